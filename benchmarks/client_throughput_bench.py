@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from itertools import cycle, islice
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from jsonl_io import read_jsonl, write_jsonl
+from chat_format import read_chat_jsonl
+
+# Runs generate_vllm_online.py and src/gen_data_local.py as subprocesses against
+# mock_openai_server.py at several concurrency levels. Reports requests/s, latency
+# percentiles as seen by the server and by the client (its --metrics_path sidecar),
+# the client's CPU time (user + sys of the client process only), and saves everything
+# as JSON for comparing versions.
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args, port, request_log):
+    cmd = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "mock_openai_server.py"),
+        "--port", str(port), "--ttft_ms", str(args.ttft_ms), "--ttft_jitter_ms", str(args.ttft_jitter_ms),
+        "--tokens_per_s", str(args.tokens_per_s), "--error_rate", str(args.error_rate),
+        "--request_log", request_log, "--seed", str(args.seed), "--trace_paths", *args.trace_paths,
+    ]
+    server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/models", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("mock server did not start")
+
+def prepare_inputs(args, work_dir):
+    """num_requests rows for each client, cycling the source datasets under fresh ids."""
+    chat_rows = list(islice(cycle(list(read_chat_jsonl(args.chat_dataset))), args.num_requests))
+    chat_rows = [{**row, "id": f"bench-{i}"} for i, row in enumerate(chat_rows)]
+    original_rows = list(islice(cycle(list(read_jsonl(args.original_dataset))), args.num_requests))
+    original_rows = [{**row, "id": f"bench-{i}"} for i, row in enumerate(original_rows)]
+    paths = {"online": os.path.join(work_dir, "chat.jsonl"), "gen_data_local": os.path.join(work_dir, "original.jsonl")}
+    write_jsonl(paths["online"], chat_rows)
+    write_jsonl(paths["gen_data_local"], original_rows)
+    return paths
+
+def client_command(client, input_path, output_path, log_path, metrics_path, base_url, concurrency, extra_args):
+    if client == "online":
+        cmd = [
+            sys.executable, os.path.join(ROOT, "generate_vllm_online.py"), "--stream",
+            "--input_path", input_path, "--output_path", output_path,
+        ]
+    else:
+        # One request per item, so every item costs the same whatever the mock answers.
+        cmd = [
+            sys.executable, os.path.join(ROOT, "src", "gen_data_local.py"), "--num_samples", "1", "--max_attempts", "1",
+            "--input_path", input_path, "--output_file", output_path,
+        ]
+    return cmd + [
+        "--api_base_url", base_url, "--model_name", "mock", "--log_file", log_path, "--metrics_path", metrics_path,
+        "--semaphore_limit", str(concurrency),
+    ] + extra_args
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+def run_one(args, client, concurrency, input_path, work_dir):
+    tag = f"{client}_c{concurrency}"
+    request_log = os.path.join(work_dir, f"{tag}_server.jsonl")
+    output_path = os.path.join(work_dir, f"{tag}_out.jsonl")
+    metrics_path = os.path.join(work_dir, f"{tag}_metrics.jsonl")
+    port = free_port()
+    server = start_server(args, port, request_log)
+    try:
+        cmd = client_command(client, input_path, output_path, os.path.join(work_dir, f"{tag}.log"), metrics_path, f"http://127.0.0.1:{port}/v1/", concurrency, args.client_args.split())
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    requests = list(read_jsonl(request_log)) if os.path.exists(request_log) else []
+    succeeded = [r for r in requests if r["status"] == 200]
+    client_requests = [r for r in read_jsonl(metrics_path) if r["status"] == "ok"] if os.path.exists(metrics_path) else []
+    cpu = rusage.ru_utime + rusage.ru_stime
+    return {
+        "client": client,
+        "concurrency": concurrency,
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "wall_s": wall,
+        "requests": len(requests),
+        "errors": len(requests) - len(succeeded),
+        "requests_per_s": len(requests) / wall,
+        "completion_tokens_per_s": sum(r["completion_tokens"] for r in succeeded) / wall,
+        "latency_s": percentiles([r["done"] - r["arrived"] for r in succeeded]),
+        "client_latency_s": percentiles([r["latency_s"] for r in client_requests if r["latency_s"] is not None]),
+        "client_queue_wait_s": percentiles([r["queue_wait_s"] for r in client_requests if r["queue_wait_s"] is not None]),
+        "client_cpu_s": cpu,
+        "client_cpu_ms_per_request": 1000 * cpu / max(len(requests), 1),
+        "client_max_rss_mb": rusage.ru_maxrss / 1024,
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, baseline=None):
+    base = {(r["client"], r["concurrency"]): r for r in (baseline or {}).get("results", [])}
+    print(f"{'client':>15} {'conc':>5} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'cpu ms/req':>10} {'errors':>6}" + ("  vs baseline" if base else ""))
+    for r in results:
+        # Client-observed latency when the client wrote its metrics sidecar.
+        lat = r["client_latency_s"] if r.get("client_latency_s", {}).get("p50") is not None else r["latency_s"]
+        line = (
+            f"{r['client']:>15} {r['concurrency']:>5} {r['requests_per_s']:8.1f} "
+            f"{lat['p50'] or 0:7.3f} {lat['p95'] or 0:7.3f} {lat['p99'] or 0:7.3f} {r['client_cpu_ms_per_request']:10.2f} {r['errors']:6d}"
+        )
+        old = base.get((r["client"], r["concurrency"]))
+        if old:
+            line += f"  req/s {r['requests_per_s'] / old['requests_per_s']:.2f}x, cpu/req {r['client_cpu_ms_per_request'] / old['client_cpu_ms_per_request']:.2f}x"
+        print(line)
+
+def main(args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        inputs = prepare_inputs(args, work_dir)
+        results = []
+        for client in args.clients:
+            for concurrency in args.concurrency:
+                result = run_one(args, client, concurrency, inputs[client], work_dir)
+                results.append(result)
+                print(f"{client} @ {concurrency}: {result['requests_per_s']:.1f} req/s, {result['client_cpu_ms_per_request']:.2f} ms CPU/req", flush=True)
+
+    report = {
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output_path", "baseline")},
+        "results": results,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output_dir = os.path.dirname(args.output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client throughput of the API generation scripts against a local mock OpenAI server.")
+    parser.add_argument("--clients", type=str, nargs="+", default=["online", "gen_data_local"], choices=["online", "gen_data_local"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256], help="--semaphore_limit values to sweep")
+    parser.add_argument("--num_requests", type=int, default=1000, help="rows sent per run")
+    parser.add_argument("--chat_dataset", type=str, default=os.path.join(ROOT, "dataset/chat/bbbp_test_reasoning_chat.jsonl"), help="input rows for generate_vllm_online.py")
+    parser.add_argument("--original_dataset", type=str, default=os.path.join(ROOT, "dataset/original/bbbp_train.jsonl"), help="input rows for gen_data_local.py")
+    parser.add_argument("--trace_paths", type=str, nargs="+", default=[os.path.join(ROOT, "result/*.jsonl")], help="completions replayed by the mock server")
+    parser.add_argument("--ttft_ms", type=float, default=50.0)
+    parser.add_argument("--ttft_jitter_ms", type=float, default=10.0)
+    parser.add_argument("--tokens_per_s", type=float, default=2000.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--client_args", type=str, default="", help="extra flags for both clients, e.g. \"--adaptive_concurrency\"")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output_path", type=str, default="benchmarks/results/client_throughput.json")
+    parser.add_argument("--baseline", type=str, default=None, help="earlier results JSON to compare against")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,181 @@
+import argparse
+import glob
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# OpenAI-compatible /v1/chat/completions stub for measuring the clients without GPUs.
+# Each request waits a time-to-first-token, then emits its completion at a fixed token
+# rate; completions (and so their lengths) are drawn from real result/*.jsonl traces.
+# A fraction of requests fails with 429/503/500. Every request is logged with its
+# server-side timing to --request_log.
+
+TRACE_COLUMNS = ("prediction", "llm_response", "llm_output")
+
+def load_completions(patterns, max_rows=5000):
+    completions = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r") as f:
+                for line in f:
+                    if len(completions) >= max_rows:
+                        return completions
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    text = next((row[c] for c in TRACE_COLUMNS if isinstance(row.get(c), str)), None)
+                    if text:
+                        completions.append(text)
+    return completions or ["reasoning...\nANSWER: YES"]
+
+def count_tokens(text):
+    """~4 characters per token, close enough for timing."""
+    return max(1, len(text) // 4)
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.completions = load_completions(args.trace_paths)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.log_f = open(args.request_log, "w") if args.request_log else None
+
+    def draw(self, n, max_tokens):
+        with self.lock:
+            texts = [self.rng.choice(self.completions) for _ in range(n)]
+            ttft = max(0.0, self.rng.gauss(self.args.ttft_ms, self.args.ttft_jitter_ms)) / 1000
+            failure = self.rng.random() < self.args.error_rate
+            status = self.rng.choice([429, 503, 500]) if failure else 200
+        if max_tokens:
+            texts = [t[:max_tokens * 4] for t in texts]
+        return texts, ttft, status
+
+    def log(self, record):
+        if self.log_f is not None:
+            with self.lock:
+                self.log_f.write(json.dumps(record) + "\n")
+                self.log_f.flush()
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-request-id", f"req_{uuid.uuid4().hex}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        arrived = time.time()
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        n = request.get("n") or 1
+        texts, ttft, status = self.state.draw(n, request.get("max_tokens"))
+        tokens = [count_tokens(t) for t in texts]
+        decode_s = max(tokens) / self.state.args.tokens_per_s
+        record = {"arrived": arrived, "status": status, "n": n, "completion_tokens": sum(tokens), "stream": bool(request.get("stream"))}
+
+        time.sleep(ttft)
+        if status != 200:
+            self._send_json(status, {"error": {"message": "mock overload" if status != 500 else "mock failure", "type": "mock", "code": status}})
+        elif request.get("stream"):
+            self._stream(request, texts, tokens, decode_s, record)
+        else:
+            time.sleep(decode_s)
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(arrived),
+                "model": request.get("model"),
+                "choices": [{"index": i, "message": {"role": "assistant", "content": t}, "finish_reason": "stop"} for i, t in enumerate(texts)],
+                "usage": {"prompt_tokens": 0, "completion_tokens": sum(tokens), "total_tokens": sum(tokens)},
+            })
+        record["first_byte"] = arrived + ttft
+        record["done"] = time.time()
+        self.state.log(record)
+
+    def _stream(self, request, texts, tokens, decode_s, record):
+        """Server-sent events, one chunk per ~chunk_tokens tokens of each choice."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        created = int(record["arrived"])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        chunk_chars = self.state.args.chunk_tokens * 4
+        step_s = self.state.args.chunk_tokens / self.state.args.tokens_per_s
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(index, delta, finish_reason=None, usage=None):
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": request.get("model"),
+                "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}] if index is not None else [],
+                "usage": usage,
+            })
+
+        try:
+            positions = [0] * len(texts)
+            for i in range(len(texts)):
+                send(chunk(i, {"role": "assistant", "content": ""}))
+            while any(p < len(t) for p, t in zip(positions, texts)):
+                time.sleep(step_s)
+                for i, text in enumerate(texts):
+                    if positions[i] < len(text):
+                        send(chunk(i, {"content": text[positions[i]:positions[i] + chunk_chars]}))
+                        positions[i] += chunk_chars
+            for i in range(len(texts)):
+                send(chunk(i, {}, "stop"))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send(chunk(None, None, usage={"prompt_tokens": 0, "completion_tokens": sum(tokens), "total_tokens": sum(tokens)}))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. after an early stop.
+            record["cancelled"] = True
+            self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server with configurable latency, token rate and error rate.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--trace_paths", type=str, nargs="*", default=["result/*.jsonl"], help="jsonl files (globs) whose prediction/llm_response/llm_output texts are replayed")
+    parser.add_argument("--ttft_ms", type=float, default=50.0, help="mean time to first token")
+    parser.add_argument("--ttft_jitter_ms", type=float, default=10.0, help="standard deviation of the time to first token")
+    parser.add_argument("--tokens_per_s", type=float, default=2000.0, help="decode rate per request")
+    parser.add_argument("--chunk_tokens", type=int, default=16, help="tokens per streamed chunk")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="fraction of requests answered with 429/503/500")
+    parser.add_argument("--request_log", type=str, default=None, help="jsonl log of per-request server-side timing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    Handler.state = MockState(args)
+    server = MockServer((args.host, args.port), Handler)
+    print(f"Mock OpenAI server on http://{args.host}:{server.server_port}/v1/ replaying {len(Handler.state.completions)} completions", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
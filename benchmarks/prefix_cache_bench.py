@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+from itertools import islice
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from prefix_cache import PrefixCache, system_prompt_key
+from chat_format import read_chat_jsonl
+
+def main(args):
+    torch.set_num_threads(args.num_threads)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = AutoModelForCausalLM.from_pretrained(args.model_path).eval()
+
+    rows = list(islice(read_chat_jsonl(args.dataset_path), args.num_rows))
+    messages_list = [[m for m in row['messages'] if m['role'] != 'assistant'] for row in rows]
+    prompts = [tokenizer.apply_chat_template(m, tokenize=False, add_generation_prompt=True) for m in messages_list]
+    input_ids_list = tokenizer(prompts)["input_ids"]
+    keys = [system_prompt_key(m) for m in messages_list]
+
+    start = time.perf_counter()
+    prefix_cache = PrefixCache(model)
+    prefix_cache.build_for_groups(keys, input_ids_list)
+    build_time = time.perf_counter() - start
+
+    full_time, cached_time, full_tokens, cached_tokens, max_diff = 0.0, 0.0, 0, 0, 0.0
+    with torch.no_grad():
+        for key, ids in zip(keys, input_ids_list):
+            input_ids = torch.tensor([ids])
+
+            start = time.perf_counter()
+            full_logits = model(input_ids=input_ids).logits[0, -1]
+            full_time += time.perf_counter() - start
+            full_tokens += len(ids)
+
+            cache = prefix_cache.get(key, ids)
+            prefix_len = cache.get_seq_length() if cache is not None else 0
+            start = time.perf_counter()
+            cached_logits = model(input_ids=input_ids[:, prefix_len:], past_key_values=cache, use_cache=True).logits[0, -1]
+            cached_time += time.perf_counter() - start
+            cached_tokens += len(ids) - prefix_len
+
+            max_diff = max(max_diff, (full_logits - cached_logits).abs().max().item())
+
+    print(f"Rows: {len(rows)}, prompt types: {len(set(keys))}")
+    print(f"Prefix cache build: {build_time:.3f}s")
+    print(f"Full prefill:   {full_time:.3f}s for {full_tokens} tokens")
+    print(f"Cached prefill: {cached_time:.3f}s for {cached_tokens} tokens (includes cache copy)")
+    print(f"Speedup: {full_time / cached_time:.2f}x, max last-token logit difference: {max_diff:.2e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prefill time with and without the shared system-prompt KV cache on CPU.")
+    parser.add_argument("--model_path", type=str, default="Qwen/Qwen2.5-0.5B-Instruct", help="small causal LM to benchmark")
+    parser.add_argument("--dataset_path", type=str, default="dataset/chat/bbbp_test_reasoning_chat.jsonl", help="chat-formatted jsonl")
+    parser.add_argument("--num_rows", type=int, default=50, help="number of rows to prefill")
+    parser.add_argument("--num_threads", type=int, default=4, help="torch CPU threads")
+    args = parser.parse_args()
+    main(args)
@@ -1,44 +1,169 @@
-import json
 import asyncio
 import logging
-from pathlib import Path
 import argparse
 import os
-from typing import Dict, Any, Optional, List
+import sys
+import time
+from collections import Counter
+from typing import Dict, Any, Optional, List, Tuple
 from openai import AsyncOpenAI, APIError
+from tqdm import tqdm
 from tqdm.asyncio import tqdm_asyncio
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from adaptive_limiter import AdaptiveLimiter, is_overload_error
+from jsonl_io import dumps, load_done_ids
+from chat_format import read_chat_jsonl
+from response_cache import ResponseCache
+from request_metrics import RequestMetrics, new_stats, fill_stats
+from early_stop import EarlyStop
+from self_consistency import SelfConsistency, parse_vote
+
+SAMPLING_PARAMS = {"max_tokens": 1024, "temperature": 0.1}
+FAILED_RESPONSE = "LLM_RESPONSE_FAILED"
+
 # --- Core Functions ---
 
 async def get_llm_response(
     messages: List[Dict[str, str]],
     session: AsyncOpenAI,
     model_name: str,
+    limiter: Optional[AdaptiveLimiter] = None,
+    cache: Optional[ResponseCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    early_stop: Optional[EarlyStop] = None,
 ) -> Optional[str]:
+    """Returns the content; if given, `stats` is filled with timing, usage and retries (see request_metrics.py)."""
+    # Responses cut at the answer line are cached apart from full ones.
+    cache_params = SAMPLING_PARAMS if early_stop is None else {**SAMPLING_PARAMS, "early_stop_max_chars": early_stop.max_chars}
+    if cache is not None:
+        cached = cache.get(model_name, messages, cache_params)
+        if cached is not None:
+            if stats is not None:
+                stats.update(cached=True, status="ok")
+            return cached
+    stats = new_stats() if stats is None else stats
+    start = time.monotonic()
     try:
-        response = await session.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            max_tokens=1024,
-            temperature=0.1,
-        )
-        return response.choices[0].message.content
+        if early_stop is not None:
+            texts, tokens, _ = await early_stop.create(session, stats, model=model_name, messages=messages, **SAMPLING_PARAMS)
+            content = texts[0]
+        else:
+            raw = await session.chat.completions.with_raw_response.create(
+                model=model_name,
+                messages=messages,
+                **SAMPLING_PARAMS,
+            )
+            response = raw.parse()
+            fill_stats(stats, start, response.usage, raw.retries_taken)
+            tokens = response.usage.completion_tokens if response.usage else None
+            content = response.choices[0].message.content
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, tokens=tokens, retries=stats["retries"])
+        if cache is not None:
+            cache.put(model_name, messages, cache_params, content)
+        return content
     except APIError as e:
         logging.error(f"API Error occurred: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False, overloaded=is_overload_error(e))
     except Exception as e:
         logging.error(f"An unexpected error occurred during API call: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False)
     return None
 
+async def get_llm_samples(
+    messages: List[Dict[str, str]],
+    session: AsyncOpenAI,
+    model_name: str,
+    n: int,
+    params: Dict[str, Any],
+    limiter: Optional[AdaptiveLimiter] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    early_stop: Optional[EarlyStop] = None,
+) -> Tuple[List[str], int]:
+    """Requests `n` completions in one call. Returns the contents and the completion tokens spent."""
+    stats = new_stats() if stats is None else stats
+    start = time.monotonic()
+    try:
+        if early_stop is not None:
+            contents, tokens, _ = await early_stop.create(session, stats, model=model_name, messages=messages, n=n, **params)
+        else:
+            raw = await session.chat.completions.with_raw_response.create(
+                model=model_name,
+                messages=messages,
+                n=n,
+                **params,
+            )
+            response = raw.parse()
+            fill_stats(stats, start, response.usage, raw.retries_taken)
+            tokens = response.usage.completion_tokens if response.usage else 0
+            contents = [choice.message.content for choice in response.choices]
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, tokens=tokens // n if tokens else None, retries=stats["retries"])
+        return [content for content in contents if content], tokens
+    except APIError as e:
+        logging.error(f"API Error occurred: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False, overloaded=is_overload_error(e))
+    except Exception as e:
+        logging.error(f"An unexpected error occurred during API call: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False)
+    return [], 0
+
+async def vote_row(
+    messages: List[Dict[str, str]],
+    session: AsyncOpenAI,
+    model_name: str,
+    voter: SelfConsistency,
+    params: Dict[str, Any],
+    limiter: Optional[AdaptiveLimiter] = None,
+    metrics: Optional[RequestMetrics] = None,
+    item_id: Any = None,
+    queue_wait: Optional[float] = None,
+    early_stop: Optional[EarlyStop] = None,
+) -> Dict[str, Any]:
+    """Draws samples in batches of `voter.votes_per_request` until the vote is decided or the budget is spent."""
+    texts, drawn, tokens, round_ = [], 0, 0, 0
+    votes = Counter()
+    while voter.decision(votes) is None and voter.next_batch(drawn) > 0:
+        n = voter.next_batch(drawn)
+        stats = new_stats() if metrics is not None else None
+        samples, spent = await get_llm_samples(messages, session, model_name, n, params, limiter, stats, early_stop)
+        round_ += 1
+        if metrics is not None:
+            # Only the first round waited for a slot.
+            metrics.record(item_id, queue_wait if round_ == 1 else 0.0, stats, round=round_, n=n)
+        texts.extend(samples)
+        drawn += n
+        tokens += spent
+        votes.update(answer for answer in map(parse_vote, samples) if answer)
+    return voter.finish(texts, drawn, tokens)
+
 async def process_row(
     row: Dict[str, Any],
     session: AsyncOpenAI,
-    semaphore: asyncio.Semaphore,
+    semaphore,
     model_name: str,
     messages_key: str,
     output_path: str,
     save_per_row: bool,
+    cache: Optional[ResponseCache] = None,
+    metrics: Optional[RequestMetrics] = None,
+    enqueued_at: Optional[float] = None,
+    early_stop: Optional[EarlyStop] = None,
+    voter: Optional[SelfConsistency] = None,
+    vote_params: Optional[Dict[str, Any]] = None,
 ):
+    enqueued_at = enqueued_at or time.monotonic()
     async with semaphore:
+        queue_wait = time.monotonic() - enqueued_at
         messages = row.get(messages_key, [])
         if not messages:
             return None
@@ -48,21 +173,94 @@ async def process_row(
         if messages[-1].get("role") == "assistant":
             prompt_messages = messages[:-1]
 
-        llm_output = await get_llm_response(prompt_messages, session, model_name)
+        limiter = semaphore if isinstance(semaphore, AdaptiveLimiter) else None
+        if voter is not None:
+            vote = await vote_row(prompt_messages, session, model_name, voter, vote_params, limiter, metrics, row.get("id"), queue_wait, early_stop)
+        else:
+            stats = new_stats() if metrics is not None else None
+            vote = {"llm_response": await get_llm_response(prompt_messages, session, model_name, limiter, cache, stats, early_stop)}
+            if metrics is not None:
+                metrics.record(row.get("id"), queue_wait, stats)
 
-        if llm_output is None:
-            llm_output = "LLM_RESPONSE_FAILED"
+        if vote["llm_response"] is None:
+            vote["llm_response"] = FAILED_RESPONSE
             logging.error(f"Failed to get response for row: {row.get('id', 'N/A')}")
 
         result = row.copy()
-        result["llm_response"] = llm_output
+        result.update(vote)
 
         if save_per_row:
-            with open(output_path, "a") as f:
-                f.write(json.dumps(result) + "\n")
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(dumps(result) + "\n")
         
         return result
 
+def load_resume_ids(output_path: str) -> set:
+    """Ids already in the output. Rows whose request failed are dropped from it and retried."""
+    done_ids = load_done_ids(output_path, failed=lambda row: row.get("llm_response") == FAILED_RESPONSE)
+    logging.info(f"Resuming: {len(done_ids)} ids already present in {output_path}.")
+    return done_ids
+
+# --- Streaming Mode ---
+
+async def run_streaming(args, async_client: AsyncOpenAI, semaphore, cache: Optional[ResponseCache] = None, metrics: Optional[RequestMetrics] = None, early_stop: Optional[EarlyStop] = None, voter: Optional[SelfConsistency] = None):
+    """
+    Bounded producer/consumer pipeline: a producer reads the input lazily into a
+    queue of fixed size and `semaphore_limit` workers drain it, appending each
+    result to the output file as soon as it arrives.
+    """
+    if args.resume:
+        done_ids = load_resume_ids(args.output_path)
+    else:
+        done_ids = set()
+        if os.path.exists(args.output_path):
+            os.remove(args.output_path)
+
+    num_workers = args.semaphore_limit
+    params = voting_params(args)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=num_workers * 2)
+    progress = tqdm(desc="Sending requests to LLM", unit="row")
+    skipped = 0
+
+    async def producer():
+        nonlocal skipped
+        for row in read_chat_jsonl(args.input_path):
+            if row.get("id") in done_ids:
+                skipped += 1
+                continue
+            await queue.put((row, time.monotonic()))
+        for _ in range(num_workers):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            row, enqueued_at = item
+            await process_row(row, async_client, semaphore, args.model_name, args.messages_key, args.output_path, True, cache, metrics, enqueued_at, early_stop, voter, params)
+            progress.update(1)
+
+    await asyncio.gather(producer(), *(worker() for _ in range(num_workers)))
+    progress.close()
+    logging.info(f"Processed {progress.n} rows, skipped {skipped} already completed rows.")
+
+def voting_params(args) -> Dict[str, Any]:
+    return {**SAMPLING_PARAMS, "temperature": args.vote_temperature}
+
+def log_summaries(args, semaphore, cache: Optional[ResponseCache], metrics: Optional[RequestMetrics], early_stop: Optional[EarlyStop] = None, voter: Optional[SelfConsistency] = None):
+    if args.adaptive_concurrency:
+        logging.info(semaphore.summary())
+    if voter is not None:
+        logging.info(voter.summary())
+    if cache is not None:
+        logging.info(cache.summary())
+    if early_stop is not None:
+        logging.info(early_stop.summary())
+    if metrics is not None:
+        logging.info(metrics.summary())
+        metrics.close()
+
 async def main(args):
     # --- Logging Setup ---
     logging.basicConfig(
@@ -78,32 +276,46 @@ async def main(args):
         logging.error(f"Input file not found: {args.input_path}")
         return
 
-    with open(args.input_path, "r") as f:
-        tasks_to_run = [json.loads(line) for line in f]
+    async_client = AsyncOpenAI(base_url=args.api_base_url, api_key=args.api_key)
+    if args.adaptive_concurrency:
+        semaphore = AdaptiveLimiter(initial_limit=args.initial_concurrency, max_limit=args.semaphore_limit)
+    else:
+        semaphore = asyncio.Semaphore(args.semaphore_limit)
+
+    cache = ResponseCache(args.cache_path, args.cache_max_bytes, args.cache_max_temperature) if args.cache_path else None
+    metrics = RequestMetrics(args.metrics_path, args.metrics_log_interval) if args.metrics_path or args.report_metrics else None
+    early_stop = EarlyStop(args.max_response_chars) if args.early_stop else None
+    voter = SelfConsistency(args.max_votes, args.votes_per_request, args.sprt_p, args.sprt_alpha, args.sprt_beta) if args.self_consistency else None
+
+    if args.stream:
+        await run_streaming(args, async_client, semaphore, cache, metrics, early_stop, voter)
+        log_summaries(args, semaphore, cache, metrics, early_stop, voter)
+        return
+
+    done_ids = load_resume_ids(args.output_path) if args.resume else set()
+    tasks_to_run = [row for row in read_chat_jsonl(args.input_path) if row.get("id") not in done_ids]
 
     logging.info(f"Found {len(tasks_to_run)} entries to process.")
     if not tasks_to_run:
         return
 
     # If not saving per row, clear the output file
-    if not args.save_per_row and os.path.exists(args.output_path):
+    if not args.save_per_row and not args.resume and os.path.exists(args.output_path):
         os.remove(args.output_path)
 
-    async_client = AsyncOpenAI(base_url=args.api_base_url, api_key=args.api_key)
-    semaphore = asyncio.Semaphore(args.semaphore_limit)
-
     async_tasks = [
-        process_row(row, async_client, semaphore, args.model_name, args.messages_key, args.output_path, args.save_per_row)
+        process_row(row, async_client, semaphore, args.model_name, args.messages_key, args.output_path, args.save_per_row, cache, metrics, None, early_stop, voter, voting_params(args))
         for row in tasks_to_run
     ]
 
     results = await tqdm_asyncio.gather(*async_tasks, desc="Sending requests to LLM")
+    log_summaries(args, semaphore, cache, metrics, early_stop, voter)
 
     if not args.save_per_row:
-        with open(args.output_path, "w") as f:
+        with open(args.output_path, "a" if args.resume else "w", encoding="utf-8") as f:
             for res in results:
                 if res:
-                    f.write(json.dumps(res) + "\n")
+                    f.write(dumps(res) + "\n")
         logging.info(f"Saved all results to {args.output_path}")
 
 if __name__ == '__main__':
@@ -112,7 +324,9 @@ if __name__ == '__main__':
     parser.add_argument("--model_name", type=str, default="kmel", help="Name of the model to use.")
     parser.add_argument("--api_base_url", type=str, default="http://localhost:8010/v1/", help="API base URL for the LLM.")
     parser.add_argument("--api_key", type=str, default="EMPTY", help="API key for the LLM.")
-    parser.add_argument("--semaphore_limit", type=int, default=500, help="Concurrency limit for API requests.")
+    parser.add_argument("--semaphore_limit", type=int, default=500, help="Concurrency limit for API requests (upper bound with --adaptive_concurrency).")
+    parser.add_argument("--adaptive_concurrency", action="store_true", help="Adjust the number of in-flight requests from observed latency and errors (AIMD).")
+    parser.add_argument("--initial_concurrency", type=int, default=16, help="Starting concurrency for --adaptive_concurrency.")
     
     parser.add_argument("--input_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning4/dataset/chat/hiv_test_reasoning_chat.jsonl", help="Path to the input .jsonl file.")
     parser.add_argument("--output_path", type=str, default="result.jsonl", help="Path to save the output .jsonl file.")
@@ -120,6 +334,23 @@ if __name__ == '__main__':
     
     parser.add_argument("--messages_key", type=str, default="messages", help="The key in the JSON object that contains the list of messages.")
     parser.add_argument("--save_per_row", action="store_true", help="Save the output for each row as it's processed.")
+    parser.add_argument("--stream", action="store_true", help="Read the input lazily and keep only a bounded window of in-flight requests. Results are always saved per row.")
+    parser.add_argument("--cache_path", type=str, default=None, help="SQLite file for the persistent response cache. Disabled when unset.")
+    parser.add_argument("--cache_max_bytes", type=int, default=2 * 1024 ** 3, help="Evict least recently used responses beyond this size.")
+    parser.add_argument("--cache_max_temperature", type=float, default=0.1, help="Only cache requests at or below this temperature.")
+    parser.add_argument("--resume", action="store_true", help="Skip ids already present in --output_path and append to it instead of overwriting it. Failed rows are run again.")
+    parser.add_argument("--metrics_path", type=str, default=None, help="Sidecar jsonl with one line per request: queue wait, TTFT, latency, token usage, retries.")
+    parser.add_argument("--report_metrics", action="store_true", help="Log the live and end-of-run request summary even without --metrics_path.")
+    parser.add_argument("--early_stop", action="store_true", help="Stream completions and cancel each request as soon as its ANSWER line arrives.")
+    parser.add_argument("--max_response_chars", type=int, default=0, help="With --early_stop, also cancel a request once its reasoning plus content exceed this many characters (0 for no limit).")
+    parser.add_argument("--self_consistency", action="store_true", help="Majority-vote over sampled reasoning traces per row; writes the YES vote fraction as p_yes for evaluate_auroc.py --score_column.")
+    parser.add_argument("--max_votes", type=int, default=16, help="With --self_consistency, most samples drawn per row.")
+    parser.add_argument("--votes_per_request", type=int, default=4, help="With --self_consistency, samples per request (n); the SPRT is checked after each request.")
+    parser.add_argument("--vote_temperature", type=float, default=0.7, help="Sampling temperature with --self_consistency.")
+    parser.add_argument("--sprt_p", type=float, default=0.7, help="Majority share the SPRT tests for; lower values need more votes to stop.")
+    parser.add_argument("--sprt_alpha", type=float, default=0.05, help="SPRT probability of deciding YES when the majority is NO.")
+    parser.add_argument("--sprt_beta", type=float, default=0.05, help="SPRT probability of deciding NO when the majority is YES.")
+    parser.add_argument("--metrics_log_interval", type=float, default=30.0, help="Seconds between live summaries.")
 
     args = parser.parse_args()
     asyncio.run(main(args))
\ No newline at end of file
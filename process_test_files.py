@@ -1,8 +1,12 @@
 
 
 import os
+import sys
 import json
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from jsonl_io import iter_lines, loads, dumps
+
 def process_test_files():
     """
     Processes JSONL chat files to extract the assistant's response into a 'label'.
@@ -47,10 +51,11 @@ def process_test_files():
         print(f"Processing '{filename}'...")
 
         try:
-            with open(input_path, 'r') as infile, open(output_path, 'w') as outfile:
-                for line in infile:
+            with open(output_path, 'w', encoding='utf-8') as outfile:
+                for _, line in iter_lines(input_path):
+                    line = line.decode('utf-8')
                     try:
-                        data = json.loads(line)
+                        data = loads(line)
                         chat_list = data.get("message", [])
                         
                         assistant_response = None
@@ -63,7 +68,7 @@ def process_test_files():
                         if assistant_response is not None:
                             # Add the new 'label' key
                             data['label'] = assistant_response
-                            outfile.write(json.dumps(data) + '\n')
+                            outfile.write(dumps(data) + '\n')
                         else:
                             print(f"Warning: No assistant response found in line: {line.strip()}")
 
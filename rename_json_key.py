@@ -1,7 +1,11 @@
 import os
+import sys
 import json
 import shutil
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from jsonl_io import loads, dumps
+
 def rename_key_in_file(file_path, old_key, new_key):
     """
     Renames a key in each JSON object within a single JSON or JSONL file.
@@ -12,15 +16,15 @@ def rename_key_in_file(file_path, old_key, new_key):
     is_jsonl = file_path.endswith('.jsonl')
 
     try:
-        with open(file_path, 'r') as infile, open(temp_file_path, 'w') as outfile:
+        with open(file_path, 'r', encoding='utf-8') as infile, open(temp_file_path, 'w', encoding='utf-8') as outfile:
             if is_jsonl:
                 for line in infile:
                     try:
-                        data = json.loads(line)
+                        data = loads(line)
                         if old_key in data:
                             data[new_key] = data.pop(old_key)
                             replacements_count += 1
-                        outfile.write(json.dumps(data) + '\n')
+                        outfile.write(dumps(data) + '\n')
                     except json.JSONDecodeError:
                         # Write invalid lines back as they were
                         outfile.write(line)
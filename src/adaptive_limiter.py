@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter that can be used in place of `asyncio.Semaphore`.
+
+    The number of in-flight requests grows additively while the server keeps up
+    and is cut multiplicatively on errors, 429/503 responses (including ones the
+    client retried on its own), or when latency
+    (per completion token when token counts are reported) rises well above the
+    best latency observed so far.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 500,
+        decrease_factor: float = 0.7,
+        latency_tolerance: float = 2.0,
+        log_interval: float = 30.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.log_interval = log_interval
+
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._slow_start = True
+        self._best_latency: Optional[float] = None
+        self._smoothed_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._last_log = time.monotonic()
+        self._limit_sum = 0.0
+        self._num_records = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+
+    async def release(self):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def record(self, latency: float, success: bool = True, overloaded: bool = False, tokens: Optional[int] = None, retries: int = 0):
+        """
+        Feeds the outcome of one request back into the controller. `retries` is the
+        number of attempts the client retried internally (`retries_taken`); the openai
+        client retries 429/503 itself, so a retried success still signals congestion.
+        """
+        now = time.monotonic()
+        metric = latency / tokens if tokens else latency
+        overloaded = overloaded or retries > 0
+
+        # Latency of a retried request includes the client's backoff.
+        if success and not retries:
+            self._best_latency = metric if self._best_latency is None else min(self._best_latency, metric)
+            self._smoothed_latency = metric if self._smoothed_latency is None else 0.9 * self._smoothed_latency + 0.1 * metric
+
+        congested = not success or overloaded or (
+            self._smoothed_latency is not None
+            and self._smoothed_latency > self.latency_tolerance * self._best_latency
+        )
+
+        if congested:
+            # Only back off once per round trip so a burst of failures from the
+            # same window does not collapse the limit to the minimum.
+            if now - self._last_decrease > latency:
+                self._slow_start = False
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+                if self._smoothed_latency is not None:
+                    self._best_latency = max(self._best_latency, self._smoothed_latency / self.latency_tolerance)
+                logging.info(f"Concurrency decreased to {int(self.limit)} (overloaded={overloaded}, success={success}).")
+        elif self._slow_start:
+            self.limit = min(self.max_limit, self.limit + 1)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        self._limit_sum += self.limit
+        self._num_records += 1
+        if now - self._last_log > self.log_interval:
+            self._last_log = now
+            logging.info(f"Concurrency limit: {int(self.limit)} (in flight: {self._in_flight}).")
+
+    def summary(self) -> str:
+        mean_limit = self._limit_sum / self._num_records if self._num_records else self.limit
+        return f"Adaptive concurrency settled at {int(self.limit)} (mean {mean_limit:.1f} over {self._num_records} requests)."
+
+
+def is_overload_error(e: Exception) -> bool:
+    """True for 429/503 responses, which signal the server is saturated rather than broken."""
+    return getattr(e, "status_code", None) in (429, 503)
@@ -0,0 +1,57 @@
+from typing import Any, Dict, Iterator, Optional
+
+from jsonl_io import read_jsonl
+from columnar_io import is_parquet, iter_parquet
+
+# A compact chat file starts with one header line holding the system prompts by id
+# and the column the user turn is read from. Every following row keeps only its own
+# fields plus a "prompt_id", and, for training rows, the assistant turn:
+#
+#   {"__chat_templates__": {"bbbp_reasoning": "You are ..."}, "user_column": "SELFIES"}
+#   {"prompt_id": "bbbp_reasoning", "SELFIES": "[C]...", "result": "Yes.", "id": "...", "assistant": "..."}
+#
+# read_chat_jsonl expands such rows to the full {"messages", "SELFIES", "result", "id"}
+# rows that create_chat_jsonl.py writes by default, and passes full files through as is.
+
+HEADER_KEY = "__chat_templates__"
+
+def compact_header(templates: Dict[str, str], user_column: str) -> Dict[str, Any]:
+    return {HEADER_KEY: templates, "user_column": user_column}
+
+def is_header(row: Dict[str, Any]) -> bool:
+    return HEADER_KEY in row
+
+def compact_row(data: Dict[str, Any], prompt_id: str, user_column: str, assistant: Optional[str], if_test: bool) -> Dict[str, Any]:
+    row = {"prompt_id": prompt_id, "SELFIES": data.get("SELFIES"), "result": data.get("result"), "id": data.get("id")}
+    if user_column not in row:
+        row[user_column] = data.get(user_column)
+    if not if_test:
+        row["assistant"] = assistant
+    return row
+
+def expand_row(row: Dict[str, Any], header: Dict[str, Any]) -> Dict[str, Any]:
+    messages = [
+        {"role": "system", "content": header[HEADER_KEY][row["prompt_id"]]},
+        {"role": "user", "content": row.get(header["user_column"])},
+    ]
+    if "assistant" in row:
+        messages.append({"role": "assistant", "content": row["assistant"]})
+    expanded = {"messages": messages, "SELFIES": row.get("SELFIES"), "result": row.get("result"), "id": row.get("id")}
+    for key, value in row.items():
+        if key not in expanded and key not in ("prompt_id", "assistant", header["user_column"]):
+            expanded[key] = value
+    return expanded
+
+def read_chat_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Rows of a chat file with "messages", expanding compact files lazily, one row at a time."""
+    if is_parquet(path):
+        yield from iter_parquet(path)
+        return
+    header = None
+    for row in read_jsonl(path):
+        if is_header(row):
+            header = row
+        elif header is not None:
+            yield expand_row(row, header)
+        else:
+            yield row
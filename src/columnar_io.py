@@ -0,0 +1,86 @@
+import argparse
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from jsonl_io import read_jsonl, write_jsonl
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Optional Parquet (zstd) storage for original, chat and result files. Any path ending
+# in .parquet is read column by column through a memory map; everything else stays JSONL.
+
+def is_parquet(path: str) -> bool:
+    return str(path).endswith(".parquet")
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("Parquet files need pyarrow (pip install pyarrow)")
+
+def read_table(path: str, columns: Optional[List[str]] = None):
+    """Arrow table of `columns` (all when None) from a Parquet file, memory-mapped."""
+    _require_pyarrow()
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+def iter_parquet(path: str, columns: Optional[List[str]] = None, batch_size: int = 1024) -> Iterator[Dict[str, Any]]:
+    _require_pyarrow()
+    with pq.ParquetFile(path, memory_map=True) as f:
+        for batch in f.iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
+
+def iter_rows(path: str, columns: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Rows of a JSONL or Parquet file. Only `columns` are decoded from Parquet; JSONL rows are projected after parsing."""
+    if is_parquet(path):
+        yield from iter_parquet(path, columns)
+        return
+    for row in read_jsonl(path):
+        yield row if columns is None else {c: row.get(c) for c in columns}
+
+def load_dataset(path: str, columns: Optional[List[str]] = None):
+    """datasets.Dataset with `columns`, backed directly by the Arrow table for Parquet files."""
+    from datasets import Dataset
+    if is_parquet(path):
+        from datasets.table import InMemoryTable
+        return Dataset(InMemoryTable(read_table(path, columns)))
+    dataset = Dataset.from_json(path)
+    return dataset.select_columns(columns) if columns is not None else dataset
+
+# --- Converters ---
+
+def jsonl_to_parquet(input_path: str, output_path: str, columns: Optional[List[str]] = None, compression: str = "zstd") -> int:
+    """Compact chat files are expanded first, so the Parquet file holds plain "messages" rows."""
+    _require_pyarrow()
+    from chat_format import read_chat_jsonl
+    rows = [row if columns is None else {c: row.get(c) for c in columns} for row in read_chat_jsonl(input_path)]
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    pq.write_table(pa.Table.from_pylist(rows), output_path, compression=compression)
+    return len(rows)
+
+def parquet_to_jsonl(input_path: str, output_path: str, columns: Optional[List[str]] = None) -> int:
+    return write_jsonl(output_path, iter_parquet(input_path, columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between JSONL and Parquet (zstd). The direction follows the input extension.")
+    parser.add_argument("--input_path", type=str, required=True, help=".jsonl or .parquet file")
+    parser.add_argument("--output_path", type=str, default=None, help="Defaults to the input path with the other extension.")
+    parser.add_argument("--columns", type=str, nargs="+", default=None, help="Keep only these columns.")
+    parser.add_argument("--compression", type=str, default="zstd", help="Parquet codec when writing Parquet.")
+    args = parser.parse_args()
+
+    stem = os.path.splitext(args.input_path)[0]
+    if is_parquet(args.input_path):
+        output_path = args.output_path or stem + ".jsonl"
+        count = parquet_to_jsonl(args.input_path, output_path, args.columns)
+    else:
+        output_path = args.output_path or stem + ".parquet"
+        count = jsonl_to_parquet(args.input_path, output_path, args.columns, args.compression)
+    print(f"Wrote {count} rows from {args.input_path} to {output_path} ({os.path.getsize(args.input_path) / 1e6:.1f} MB -> {os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
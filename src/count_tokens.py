@@ -1,57 +1,108 @@
 import argparse
+import hashlib
 import json
+import os
+from itertools import islice
+from multiprocessing import Pool
 import numpy as np
 from transformers import AutoTokenizer
 import pandas as pd
 
-def analyze_token_counts(input_file, tokenizer_name, column_name):
-    """
-    Reads a jsonl file, calculates token counts for a specific column, and prints statistics.
+_tokenizer = None
 
-    Args:
-        input_file (str): Path to the input .jsonl file.
-        tokenizer_name (str): Name of the Hugging Face tokenizer.
-        column_name (str): The column to analyze from the jsonl file.
+def _init_worker(tokenizer_name):
+    global _tokenizer
+    _tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+def _count_batch(args):
+    """Returns per-row metadata and token counts for a batch of raw jsonl lines."""
+    lines, column_names = args
+    rows, texts = [], {c: [] for c in column_names}
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            # Keep a placeholder so sidecar rows stay aligned with file lines.
+            print(f"Warning: Could not decode JSON from line: {line.strip()}")
+            data = {}
+        item_id = data.get("id")
+        rows.append({
+            "id": item_id,
+            "task": str(item_id).split("-")[0] if item_id else None,
+            "label": data.get("result", data.get("expected_result")),
+        })
+        for c in column_names:
+            text = data.get(c)
+            texts[c].append(text if isinstance(text, str) else None)
+
+    for c in column_names:
+        valid = [t for t in texts[c] if t is not None]
+        lengths = iter(len(ids) for ids in _tokenizer(valid)["input_ids"]) if valid else iter(())
+        for row, text in zip(rows, texts[c]):
+            row[c] = next(lengths) if text is not None else None
+    return rows
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def sidecar_path(input_file, tokenizer_name):
+    return f"{input_file}.{tokenizer_name.replace('/', '--')}.token_counts.jsonl"
+
+def load_token_counts(input_file, tokenizer_name, digest=None):
     """
-    print(f"Loading tokenizer: {tokenizer_name}")
-    try:
-        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
-    except Exception as e:
-        print(f"Error loading tokenizer: {e}")
-        return
-
-    token_counts = []
-    print(f"Processing file: {input_file}")
-    try:
-        with open(input_file, 'r') as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    text = data.get(column_name)
-                    if text is not None and isinstance(text, str):
-                        tokens = tokenizer.encode(text)
-                        token_counts.append(len(tokens))
-                    else:
-                        print(f"Warning: Column '{column_name}' not found or not a string in line: {line.strip()}")
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not decode JSON from line: {line.strip()}")
-
-    except FileNotFoundError:
-        print(f"Error: Input file not found at {input_file}")
-        return
+    Reads the per-row token count sidecar written by analyze_token_counts. Returns
+    (columns, rows) if it matches the current file content, otherwise (set(), None).
+    """
+    path = sidecar_path(input_file, tokenizer_name)
+    if not os.path.exists(path):
+        return set(), None
+    with open(path, 'r') as f:
+        header = json.loads(f.readline())
+        if header.get("file_hash") != (digest or file_hash(input_file)) or header.get("tokenizer") != tokenizer_name:
+            return set(), None
+        rows = [json.loads(line) for line in f]
+    return set(header["columns"]), rows
 
-    if not token_counts:
-        print("No data to analyze.")
-        return
+def count_tokens(input_file, tokenizer_name, column_names, num_workers=None, batch_size=256):
+    """Token counts per row for `column_names`, reusing the sidecar and only tokenizing missing columns."""
+    digest = file_hash(input_file)
+    cached_columns, rows = load_token_counts(input_file, tokenizer_name, digest)
+    missing = [c for c in column_names if c not in cached_columns]
+    if not missing:
+        print(f"Using cached token counts from {sidecar_path(input_file, tokenizer_name)}")
+        return rows
 
-    # Calculate statistics using pandas
-    stats = pd.Series(token_counts).describe(percentiles=[0, .25, .5, .75, 1])
-    stats_dict = stats.to_dict()
+    print(f"Tokenizing columns {missing} with {tokenizer_name}")
+    new_rows = []
+    with open(input_file, 'r') as f, Pool(num_workers or os.cpu_count(), initializer=_init_worker, initargs=(tokenizer_name,)) as pool:
+        batches = iter(lambda: (list(islice(f, batch_size)), missing), ([], missing))
+        for batch_rows in pool.imap(_count_batch, batches):
+            new_rows.extend(batch_rows)
 
-    print("\n--- Token Count Statistics ---")
-    print(f"Column analyzed: '{column_name}'")
-    print(f"Total rows processed: {len(token_counts)}")
-    print(f"avg ± std: {stats_dict.get('mean'):.2f} ± {stats_dict.get('std'):.2f}")
+    if rows is not None and len(rows) == len(new_rows):
+        for row, new_row in zip(rows, new_rows):
+            row.update({c: new_row[c] for c in missing})
+    else:
+        rows, cached_columns = new_rows, set()
+
+    columns = sorted(cached_columns | set(missing))
+    with open(sidecar_path(input_file, tokenizer_name), 'w') as f:
+        f.write(json.dumps({"file_hash": digest, "tokenizer": tokenizer_name, "columns": columns}) + "\n")
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    return rows
+
+def print_stats(counts, title):
+    stats = pd.Series(counts).describe(percentiles=[0, .25, .5, .75, 1])
+    stats_dict = stats.to_dict()
+    print(f"\n--- Token Count Statistics ---")
+    print(title)
+    print(f"Total rows processed: {len(counts)}")
+    print(f"avg ± std: {stats_dict.get('mean'):.2f} ± {stats_dict.get('std', float('nan')):.2f}")
     print(
         f"q0/q1/q2/q3/q4: "
         f"{stats_dict.get('0%'):.0f} / "
@@ -62,7 +113,45 @@ def analyze_token_counts(input_file, tokenizer_name, column_name):
     )
     print("----------------------------\n")
 
+def analyze_token_counts(input_file, tokenizer_name, column_names, num_workers=None, breakdown=False):
+    """
+    Calculates token counts for one or more columns of a jsonl file and prints statistics.
+
+    Args:
+        input_file (str): Path to the input .jsonl file.
+        tokenizer_name (str): Name of the Hugging Face tokenizer.
+        column_names (list): The columns to analyze from the jsonl file.
+        num_workers (int): Tokenizer processes. Defaults to all cores.
+        breakdown (bool): Also print statistics per task and label.
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: Input file not found at {input_file}")
+        return None
+
+    rows = count_tokens(input_file, tokenizer_name, column_names, num_workers)
+    df = pd.DataFrame(rows)
+
+    for column_name in column_names:
+        counts = df[column_name].dropna()
+        if counts.empty:
+            print(f"No data to analyze for column '{column_name}'.")
+            continue
+        print_stats(counts.tolist(), f"Column analyzed: '{column_name}'")
+        if breakdown:
+            summary = df.dropna(subset=[column_name]).groupby(["task", "label"], dropna=False)[column_name].agg(["count", "mean", "std", "max"])
+            print(summary.round(1).to_string())
+    return df
 
+def filter_by_length(input_file, tokenizer_name, column_name, max_length, output_file):
+    """Writes the rows whose `column_name` fits in `max_length` tokens, using the sidecar counts."""
+    rows = count_tokens(input_file, tokenizer_name, [column_name])
+    kept = 0
+    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
+        for line, row in zip(infile, rows):
+            if row[column_name] is not None and row[column_name] <= max_length:
+                outfile.write(line)
+                kept += 1
+    print(f"Kept {kept}/{len(rows)} rows with '{column_name}' <= {max_length} tokens in {output_file}")
 
 def main():
     """Main function to parse arguments and run the analysis."""
@@ -82,12 +171,21 @@ def main():
     parser.add_argument(
         "--column_name",
         type=str,
-        default="llm_output",
-        help="The column name within the JSON objects to analyze."
+        nargs="+",
+        default=["llm_output"],
+        help="One or more column names within the JSON objects to analyze."
     )
+    parser.add_argument("--num_workers", type=int, default=None, help="Tokenizer processes. Defaults to all cores.")
+    parser.add_argument("--breakdown", action="store_true", help="Print statistics per task (id prefix) and label.")
+    parser.add_argument("--filter_max_length", type=int, default=None, help="Write rows whose first --column_name fits in this many tokens to --filter_output.")
+    parser.add_argument("--filter_output", type=str, default=None, help="Output path for --filter_max_length.")
     args = parser.parse_args()
+    if (args.filter_max_length is None) != (args.filter_output is None):
+        parser.error("--filter_max_length and --filter_output must be given together.")
 
-    analyze_token_counts(args.input_file, args.tokenizer_name, args.column_name)
+    analyze_token_counts(args.input_file, args.tokenizer_name, args.column_name, args.num_workers, args.breakdown)
+    if args.filter_max_length is not None:
+        filter_by_length(args.input_file, args.tokenizer_name, args.column_name[0], args.filter_max_length, args.filter_output)
 
 if __name__ == "__main__":
     main()
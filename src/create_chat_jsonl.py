@@ -1,7 +1,10 @@
 
 import os
-import json
 import argparse
+from multiprocessing import Pool
+from pathlib import Path
+from jsonl_io import read_jsonl, JsonlWriter
+from chat_format import compact_header, compact_row, read_chat_jsonl
 
 def get_system_prompt(prompt_type):
     """Returns the system prompt string based on the selected type."""
@@ -15,10 +18,11 @@ def get_system_prompt(prompt_type):
     }
     return prompts.get(prompt_type, prompts["default"])
 
-def create_chat_dataset_for_file(input_file_path, system_prompt, prompt_type, input_column, result_column, output_path, if_test):
+def create_chat_dataset_for_file(input_file_path, system_prompt, prompt_type, input_column, result_column, output_path, if_test, compact=False):
     """
     Processes a single JSONL file with a given system prompt to create a
-    chat-formatted JSONL file.
+    chat-formatted JSONL file. With `compact`, the system prompt is written once
+    in a header and rows refer to it by prompt type (see chat_format.py).
     """
     if not os.path.exists(input_file_path):
         print(f"Error: The file '{input_file_path}' was not found. Skipping.")
@@ -33,37 +37,64 @@ def create_chat_dataset_for_file(input_file_path, system_prompt, prompt_type, in
     print(f"Output will be saved to '{output_path}'")
 
     try:
-        with open(input_file_path, 'r') as infile, open(output_path, 'w') as outfile:
-            for line in infile:
-                try:
-                    data = json.loads(line)
-                    input_content = data.get(input_column)
-                    result_content = data.get(result_column)
-
-                    # if input_content is None or result_content is None:
-                    #     print(f"Warning: Skipping line due to missing '{input_column}' or '{result_column}' key in: {line.strip()}")
-                    #     continue
-
-                    chat_data = {
-                        "messages":  [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": input_content}
-                        ] if if_test else [ 
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": input_content},
-                            {"role": "assistant", "content": result_content}
-                        ],
-                        "SELFIES": data.get("SELFIES"),
-                        "result" : data.get("result"),
-                        "id" : data.get("id")
-                    }
-                    outfile.write(json.dumps(chat_data) + '\n')
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping line due to invalid JSON: {line.strip()}")
+        with JsonlWriter(output_path) as outfile:
+            if compact:
+                outfile.write(compact_header({prompt_type: system_prompt}, input_column))
+            for data in read_jsonl(input_file_path):
+                input_content = data.get(input_column)
+                result_content = data.get(result_column)
+                if compact:
+                    outfile.write(compact_row(data, prompt_type, input_column, result_content, if_test))
+                    continue
+
+                # if input_content is None or result_content is None:
+                #     print(f"Warning: Skipping line due to missing '{input_column}' or '{result_column}' key in: {line.strip()}")
+                #     continue
+
+                chat_data = {
+                    "messages":  [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": input_content}
+                    ] if if_test else [ 
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": input_content},
+                        {"role": "assistant", "content": result_content}
+                    ],
+                    "SELFIES": data.get("SELFIES"),
+                    "result" : data.get("result"),
+                    "id" : data.get("id")
+                }
+                outfile.write(chat_data)
         print(f"Successfully created: {output_path}\n")
     except IOError as e:
         print(f"An error occurred during file processing for {input_file_path}: {e}\n")
 
+def expand_chat_file(input_file_path, output_path):
+    """Writes the full chat format of a compact file, for consumers that read the jsonl themselves (e.g. training)."""
+    with JsonlWriter(output_path) as outfile:
+        for row in read_chat_jsonl(input_file_path):
+            outfile.write(row)
+    print(f"Expanded '{input_file_path}' to '{output_path}'")
+
+def plan_directory(input_dir, output_dir, prompt_types, input_column, result_column, compact):
+    """
+    One job per (file, prompt type) whose task matches: dataset/original/hiv_test.jsonl
+    with hiv_reasoning becomes <output_dir>/hiv_test_hiv_reasoning_chat.jsonl. Files with
+    "_test" in the name get no assistant turn.
+    """
+    jobs = []
+    for input_file in sorted(Path(input_dir).glob("*.jsonl")):
+        base_filename = input_file.stem
+        for prompt_type in prompt_types:
+            if not base_filename.startswith(prompt_type.split("_")[0] + "_"):
+                continue
+            output_path = os.path.join(output_dir, f"{base_filename}_{prompt_type}_chat.jsonl")
+            jobs.append((str(input_file), get_system_prompt(prompt_type), prompt_type, input_column, result_column, output_path, "_test" in base_filename, compact))
+    return jobs
+
+def _run_job(job):
+    create_chat_dataset_for_file(*job)
+
 def main():
     """
     Main function to configure and run the dataset creation process.
@@ -75,9 +106,27 @@ def main():
     parser.add_argument("--type", default="train", help="The name of the column containing the result data. Defaults to 'result'.")
     parser.add_argument("--result_column", default="reasoning", help="The name of the column containing the result data. Defaults to 'result'.")
     parser.add_argument("--output_path", default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/processed_chat/hiv_train_reasoning_10k_chat.jsonl", help="The name of the column containing the result data. Defaults to 'result'.")
+    parser.add_argument("--compact", action="store_true", help="Store the system prompt once in a header line instead of in every row.")
+    parser.add_argument("--expand", action="store_true", help="Convert the compact file at --input_path to the full format at --output_path.")
+    parser.add_argument("--input_dir", default=None, help="Convert every <task>_<split>*.jsonl here for each matching --prompt_types, in parallel.")
+    parser.add_argument("--output_dir", default=None, help="Where --input_dir outputs go. Defaults to --input_dir.")
+    parser.add_argument("--prompt_types", nargs="+", default=["bace", "hiv", "bbbp"], help="Prompt types for --input_dir; each applies to files of its task prefix.")
+    parser.add_argument("--num_workers", type=int, default=None, help="Processes for --input_dir. Defaults to all cores.")
 
     args = parser.parse_args()
 
+    if args.expand:
+        expand_chat_file(args.input_path, args.output_path)
+        return
+
+    if args.input_dir:
+        jobs = plan_directory(args.input_dir, args.output_dir or args.input_dir, args.prompt_types, args.input_column, args.result_column, args.compact)
+        print(f"Converting {len(jobs)} (file, prompt type) pairs from '{args.input_dir}'")
+        with Pool(min(args.num_workers or os.cpu_count(), max(len(jobs), 1))) as pool:
+            pool.map(_run_job, jobs)
+        print("Processing complete.")
+        return
+
     system_prompt = get_system_prompt(args.prompt_type)
     create_chat_dataset_for_file(
         args.input_path,
@@ -86,7 +135,8 @@ def main():
         args.input_column,
         args.result_column,
         args.output_path,
-        args.type=='test'
+        args.type=='test',
+        args.compact
     )
 
     print("Processing complete.")
@@ -0,0 +1,100 @@
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from request_metrics import fill_stats
+
+# "ANSWER: YES" / "ANSWER: NO" at the start of a line, optionally in bold. The word
+# after YES/NO must have ended, so a chunk boundary inside "NOT" does not count.
+ANSWER_LINE = re.compile(r"^[ \t>#*]*ANSWER:[ \t*]*(YES|NO)(?=\W)", re.MULTILINE)
+
+def has_answer_line(text: str) -> bool:
+    """For complete texts, where the answer may be the very last word."""
+    return ANSWER_LINE.search(text + "\n") is not None
+
+class EarlyStop:
+    """
+    Streams chat completions and closes the connection as soon as every choice has a
+    well-formed answer line (or `accept` holds for one of them), or a choice has streamed
+    more than `max_chars` characters of reasoning plus content. vLLM aborts a request
+    when its client disconnects, so the rest of the trace is never decoded.
+    """
+
+    def __init__(self, max_chars: int = 0):
+        self.max_chars = max_chars
+        self.stop_reasons = Counter()
+        self.tokens_spent = 0
+
+    async def create(self, session, stats: Optional[Dict[str, Any]] = None, accept: Optional[Callable[[str], bool]] = None, **request) -> Tuple[List[str], int, List[bool]]:
+        """
+        Returns the content of each choice, the completion tokens spent (the usage the
+        server reports at the end of a full stream, otherwise one token per streamed chunk)
+        and, per choice, whether it was cut off here before the server finished it.
+        """
+        start = time.monotonic()
+        n = request.get("n") or 1
+        raw = await session.chat.completions.with_raw_response.create(stream=True, stream_options={"include_usage": True}, **request)
+        stream = raw.parse()
+        texts = [""] * n
+        streamed_chars = [0] * n
+        finished = [False] * n
+        server_done = [False] * n
+        capped = stopped = False
+        chunks = 0
+        usage = None
+        ttft = None
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                for choice in chunk.choices:
+                    i = choice.index
+                    delta = choice.delta
+                    content = (delta.content or "") if delta else ""
+                    # Reasoning models stream their trace separately from the answer.
+                    reasoning = (getattr(delta, "reasoning_content", None) or getattr(delta, "reasoning", None) or "") if delta else ""
+                    if content or reasoning:
+                        if ttft is None:
+                            ttft = time.monotonic() - start
+                        chunks += 1
+                        streamed_chars[i] += len(content) + len(reasoning)
+                    if content:
+                        # Only the line the new text lands on can complete an answer line.
+                        line_start = texts[i].rfind("\n") + 1
+                        texts[i] += content
+                        if not finished[i] and ANSWER_LINE.search(texts[i], line_start):
+                            finished[i] = True
+                            if accept is not None and accept(texts[i]):
+                                stopped = True
+                    if not finished[i] and self.max_chars and streamed_chars[i] > self.max_chars:
+                        finished[i] = capped = True
+                    if choice.finish_reason is not None:
+                        finished[i] = server_done[i] = True
+                if all(server_done):
+                    # Only the usage chunk is left.
+                    continue
+                if stopped or all(finished):
+                    stopped = True
+                    break
+        finally:
+            await stream.close()
+
+        stopped = stopped and not all(server_done)
+        reason = ("length" if capped else "answer") if stopped else "finished"
+        tokens = usage.completion_tokens if usage is not None else chunks
+        self.stop_reasons[reason] += 1
+        self.tokens_spent += tokens
+        fill_stats(stats, start, usage, raw.retries_taken, ttft=ttft)
+        if stats is not None:
+            stats["completion_tokens"] = tokens
+            stats["stop_reason"] = reason
+        return texts, tokens, [not done for done in server_done]
+
+    def summary(self) -> str:
+        total = sum(self.stop_reasons.values())
+        return (
+            f"Early stop: {self.stop_reasons['answer']} of {total} requests stopped at the answer line, "
+            f"{self.stop_reasons['length']} at the length cap, {self.stop_reasons['finished']} ran to completion; "
+            f"{self.tokens_spent} completion tokens spent"
+        )
@@ -12,9 +12,8 @@ Code from https://github.com/blender-nlp/MolT5
 '''
 
 import argparse
-import csv
-
-import os.path as osp
+import os
+from multiprocessing import Pool
 
 import numpy as np
 
@@ -24,101 +23,69 @@ from nltk.translate.bleu_score import corpus_bleu
 from nltk.translate.meteor_score import meteor_score
 from rouge_score import rouge_scorer
 from tqdm import tqdm
-from datasets import Dataset
+from columnar_io import load_dataset
+
+SPECIAL_TOKENS = ('[PAD]', '[CLS]', '[SEP]')
+
+_rouge_scorer = None
+
+def _init_worker():
+    global _rouge_scorer
+    _rouge_scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'])
 
-def evaluate(text_model, dataset_path, text_trunc_length, out_column, reasoning):
-    outputs = []
+def _score_pair(pair):
+    gt, out, gt_tokens, out_tokens = pair
+    rs = _rouge_scorer.score(out, gt)
+    return meteor_score([gt_tokens], out_tokens), rs['rouge1'].fmeasure, rs['rouge2'].fmeasure, rs['rougeL'].fmeasure
 
-    # with open(osp.join(input_file), encoding='utf8') as f:
-    #     reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-    #     for n, line in enumerate(reader):
-    #         out_tmp = line['output'][6:] if line['output'].startswith('[CLS] ') else line['output']
-    #         outputs.append((line['SMILES'], line['ground truth'], out_tmp))
+def extract_output(out, reasoning):
+    if(reasoning):
+        out = out.lower().split('final description:')[-1]
+    return out
 
+def batch_tokenize(text_tokenizer, texts, text_trunc_length):
+    """Matches tokenize(..., padding='max_length') followed by dropping [PAD]/[CLS]/[SEP], without padding."""
+    encodings = text_tokenizer(texts, add_special_tokens=False, truncation=True, max_length=text_trunc_length)
+    return [[t for t in encodings.tokens(i) if t not in SPECIAL_TOKENS] for i in range(len(texts))]
+
+def evaluate(text_model, dataset_path, text_trunc_length, out_column, reasoning, num_workers=None, batch_size=1024):
     text_tokenizer = BertTokenizerFast.from_pretrained(text_model)
-    dataset = Dataset.from_json(dataset_path)
-    bleu_scores = []
-    meteor_scores = []
+    dataset = load_dataset(dataset_path, ["description", out_column])
 
     references = []
     hypotheses = []
+    meteor_scores = []
+    rouge_1_scores = []
+    rouge_2_scores = []
+    rouge_l_scores = []
     print(reasoning)
-    k=0
-    for d in tqdm(dataset):
-
-        gt = d['description']
-        out = d[out_column]
-        if(reasoning):
-            out = out.lower().split('final description:')[-1]
-            # delimiter = 'final description:'
-            # lower_out = out.lower()
-            # index = lower_out.rfind(delimiter)
-
-            # if index != -1:
-            #     out = out[index + len(delimiter):]
-            # else:
-            #     out = out
-
-        gt_tokens = text_tokenizer.tokenize(gt, truncation=True, max_length=text_trunc_length,
-                                            padding='max_length')
-        gt_tokens = list(filter(('[PAD]').__ne__, gt_tokens))
-        gt_tokens = list(filter(('[CLS]').__ne__, gt_tokens))
-        gt_tokens = list(filter(('[SEP]').__ne__, gt_tokens))
-
-        out_tokens = text_tokenizer.tokenize(out, truncation=True, max_length=text_trunc_length,
-                                            padding='max_length')
-        out_tokens = list(filter(('[PAD]').__ne__, out_tokens))
-        out_tokens = list(filter(('[CLS]').__ne__, out_tokens))
-        out_tokens = list(filter(('[SEP]').__ne__, out_tokens))
-
-        references.append([gt_tokens])
-        hypotheses.append(out_tokens)
-
-        mscore = meteor_score([gt_tokens], out_tokens)
-        meteor_scores.append(mscore)
 
-    bleu2 = corpus_bleu(references, hypotheses, weights=(.5,.5))
-    bleu4 = corpus_bleu(references, hypotheses, weights=(.25,.25,.25,.25))
+    with Pool(num_workers or os.cpu_count(), initializer=_init_worker) as pool:
+        for i in tqdm(range(0, len(dataset), batch_size)):
+            batch = dataset[i:i + batch_size]
+            gts = batch['description']
+            outs = [extract_output(out, reasoning) for out in batch[out_column]]
 
-    _meteor_score = np.mean(meteor_scores)
+            gt_tokens = batch_tokenize(text_tokenizer, gts, text_trunc_length)
+            out_tokens = batch_tokenize(text_tokenizer, outs, text_trunc_length)
+            references.extend([t] for t in gt_tokens)
+            hypotheses.extend(out_tokens)
 
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'])
+            pairs = zip(gts, outs, gt_tokens, out_tokens)
+            for mscore, r1, r2, rl in pool.imap(_score_pair, pairs, chunksize=64):
+                meteor_scores.append(mscore)
+                rouge_1_scores.append(r1)
+                rouge_2_scores.append(r2)
+                rouge_l_scores.append(rl)
 
-    rouge_scores = []
+    bleu2 = corpus_bleu(references, hypotheses, weights=(.5,.5))
+    bleu4 = corpus_bleu(references, hypotheses, weights=(.25,.25,.25,.25))
 
-    references = []
-    hypotheses = []
+    _meteor_score = np.mean(meteor_scores)
+    rouge_1 = np.mean(rouge_1_scores)
+    rouge_2 = np.mean(rouge_2_scores)
+    rouge_l = np.mean(rouge_l_scores)
 
-    for i, d in enumerate(dataset):
-
-        gt = d['description']
-        out = d[out_column]
-
-        if(reasoning):
-            out = out.lower().split('final description:')[-1]
-            # delimiter = 'final description:'
-            # lower_out = out.lower()
-            # index = lower_out.rfind(delimiter)
-
-            # if index != -1:
-            #     out = out[index + len(delimiter):]
-            # else:
-            #     out = out
-        rs = scorer.score(out, gt)
-        rouge_scores.append(rs)
-
-    rouge_1 = np.mean([rs['rouge1'].fmeasure for rs in rouge_scores])
-    rouge_2 = np.mean([rs['rouge2'].fmeasure for rs in rouge_scores])
-    rouge_l = np.mean([rs['rougeL'].fmeasure for rs in rouge_scores])
-    # print('rouge1:', rouge_1*100)
-    # print('rouge2:', rouge_2*100)
-    # print('rougeL:', rouge_l*100)
-    
-    # print('BLEU-2 score:', round(bleu2*100,1))
-    # print('BLEU-4 score:', round(bleu4*100,1))
-    # print('Meteor score:', _meteor_score)
-    # print("BLEU-2\tBLUE-4\trouge1\trouge2\trouge\tMETEORL")
-    # print(round(blue2*100,1),round(blue4*100,1),round(rouge1*100,1),round(rouge2*100,1),round(rougeL*100,1),round(_meteor_score*100,1))
     print(f"{'BLEU-2':>8} {'BLEU-4':>8} {'ROUGE-1':>8} {'ROUGE-2':>8} {'ROUGE-L':>8} {'METEOR':>8}")
     print(f"{bleu2*100:8.1f} {bleu4*100:8.1f} {rouge_1*100:8.1f} {rouge_2*100:8.1f} {rouge_l*100:8.1f} {_meteor_score*100:8.1f}")
 
@@ -130,6 +97,7 @@ if __name__ == "__main__":
     parser.add_argument('--dataset_path', type=str, default='', help='path where test generations are saved')
     parser.add_argument('--out_column', type=str, default='prediction', help='path where test generations are saved')
     parser.add_argument('--reasoning', action='store_true', help='path where test generations are saved')
-    parser.add_argument('--text_trunc_length', type=str, default=512, help='tokenizer maximum length')
+    parser.add_argument('--text_trunc_length', type=int, default=512, help='tokenizer maximum length')
+    parser.add_argument('--num_workers', type=int, default=None, help='processes used for METEOR/ROUGE scoring (defaults to all cores)')
     args = parser.parse_args()
-    evaluate(args.text_model, args.dataset_path, args.text_trunc_length, args.out_column,args.reasoning)
\ No newline at end of file
+    evaluate(args.text_model, args.dataset_path, args.text_trunc_length, args.out_column, args.reasoning, args.num_workers)
\ No newline at end of file
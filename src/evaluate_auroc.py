@@ -1,16 +1,68 @@
+import argparse
+import numpy as np
+from scipy.stats import rankdata
 from sklearn import metrics
-from datasets import Dataset
+from columnar_io import load_dataset
 
 # test = Dataset.from_json('/home/tkdrnjs0621/work/kmel-reasoning2/result/bace_test.jsonl')
-# y_true = [1 if ref == 'Yes.' else 0 for ref in test["label"]] 
-# y_pred =  [1 if ref == 'Yes.' else 0 for ref in test["prediction"]] 
+# y_true = [1 if ref == 'Yes.' else 0 for ref in test["label"]]
+# y_pred =  [1 if ref == 'Yes.' else 0 for ref in test["prediction"]]
 
 # auroc = metrics.roc_auc_score(y_true, y_pred)
 # print(auroc)
 
-test = Dataset.from_json('/home/tkdrnjs0621/work/kmel-reasoning3/result/hiv_reasoning.jsonl')
-y_true = [1 if ref == 'Yes.' else 0 for ref in test["result"]] 
-y_pred =  [1 if 'yes' in ref.lower().split('answer:')[-1] else 0 for ref in test["prediction"]] 
+def bootstrap_auroc(y_true, y_score, n_bootstrap=1000, alpha=0.05, seed=0, block_size=100):
+    """
+    Percentile bootstrap CI for AUROC. Each block of resamples is ranked at once with
+    rankdata(axis=1) and scored with the Mann-Whitney formula, so there is no Python loop per resample.
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    y_score = np.asarray(y_score, dtype=float)
+    n = len(y_true)
+    rng = np.random.default_rng(seed)
+    aucs = []
+    for start in range(0, n_bootstrap, block_size):
+        idx = rng.integers(0, n, size=(min(block_size, n_bootstrap - start), n))
+        labels = y_true[idx]
+        ranks = rankdata(y_score[idx], axis=1)
+        n_pos = labels.sum(axis=1)
+        n_neg = n - n_pos
+        with np.errstate(divide='ignore', invalid='ignore'):
+            auc = ((ranks * labels).sum(axis=1) - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+        aucs.append(auc)
+    aucs = np.concatenate(aucs)
+    # Resamples that drew a single class have no AUROC.
+    aucs = aucs[np.isfinite(aucs)]
+    return np.percentile(aucs, 100 * alpha / 2), np.percentile(aucs, 100 * (1 - alpha / 2))
 
-auroc = metrics.roc_auc_score(y_true, y_pred)
-print(auroc)
+def main(args):
+    test = load_dataset(args.dataset_path, [args.label_column, args.score_column or args.pred_column])
+    y_true = [1 if ref == 'Yes.' else 0 for ref in test[args.label_column]]
+    if args.score_column:
+        # Rows whose scoring failed carry no score.
+        scored = [(t, s) for t, s in zip(y_true, test[args.score_column]) if s is not None]
+        if len(scored) < len(y_true):
+            print(f"Skipping {len(y_true) - len(scored)} rows without a {args.score_column} score")
+        y_true = [t for t, _ in scored]
+        y_pred = [s for _, s in scored]
+    else:
+        y_pred = [1 if 'yes' in ref.lower().split('answer:')[-1] else 0 for ref in test[args.pred_column]]
+
+    auroc = metrics.roc_auc_score(y_true, y_pred)
+    print(auroc)
+    if args.n_bootstrap > 0:
+        low, high = bootstrap_auroc(y_true, y_pred, args.n_bootstrap, args.alpha, args.seed)
+        print(f"{100 * (1 - args.alpha):.0f}% CI: [{low:.4f}, {high:.4f}]")
+    return auroc
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AUROC of YES/NO predictions, from parsed answers or P(YES) scores.")
+    parser.add_argument("--dataset_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/result/hiv_reasoning.jsonl", help="prediction jsonl or parquet")
+    parser.add_argument("--label_column", type=str, default="result", help="column with the Yes./No. label")
+    parser.add_argument("--pred_column", type=str, default="prediction", help="column with the generated answer")
+    parser.add_argument("--score_column", type=str, default=None, help="column with P(YES), e.g. p_yes from score_logprob.py or generate_vllm_online.py --self_consistency; overrides --pred_column")
+    parser.add_argument("--n_bootstrap", type=int, default=0, help="number of bootstrap resamples for a confidence interval (0 to skip)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="1 - confidence level")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import math
+import os
+import time
+from collections import Counter
+
+def follow_jsonl(path, follow, poll_interval, idle_timeout):
+    """
+    Yields rows from a JSONL file that may still be growing. A line is only parsed once
+    its trailing newline has been written. With `follow`, waits for new data until the
+    file has been idle for `idle_timeout` seconds.
+    """
+    while follow and not os.path.exists(path):
+        time.sleep(poll_interval)
+    with open(path, 'r') as f:
+        buffer = ''
+        idle_since = time.monotonic()
+        while True:
+            chunk = f.readline()
+            if chunk:
+                buffer += chunk
+                if not buffer.endswith('\n'):
+                    continue
+                line, buffer = buffer.strip(), ''
+                idle_since = time.monotonic()
+                if line:
+                    yield json.loads(line)
+            elif not follow or time.monotonic() - idle_since > idle_timeout:
+                return
+            else:
+                time.sleep(poll_interval)
+
+class StreamingAUROC:
+    """AUROC and accuracy from per-bin label counts, so memory does not grow with the number of rows."""
+
+    def __init__(self, num_bins=1000):
+        self.num_bins = num_bins
+        self.pos = [0] * (num_bins + 1)
+        self.neg = [0] * (num_bins + 1)
+        self.correct = 0
+        self.n = 0
+
+    def update(self, y_true, score):
+        b = min(self.num_bins, max(0, int(round(score * self.num_bins))))
+        if y_true:
+            self.pos[b] += 1
+        else:
+            self.neg[b] += 1
+        self.correct += int((score >= 0.5) == bool(y_true))
+        self.n += 1
+
+    def auroc(self):
+        total_pos, total_neg = sum(self.pos), sum(self.neg)
+        if total_pos == 0 or total_neg == 0:
+            return float('nan')
+        # Probability that a random positive outranks a random negative, ties counted as half.
+        area, neg_below = 0.0, 0
+        for p, q in zip(self.pos, self.neg):
+            area += p * (neg_below + 0.5 * q)
+            neg_below += q
+        return area / (total_pos * total_neg)
+
+    def accuracy(self):
+        return self.correct / self.n if self.n else float('nan')
+
+    def report(self):
+        return f"rows={self.n} AUROC={self.auroc():.4f} ACC={self.accuracy():.4f}"
+
+class StreamingCaptionMetrics:
+    """Corpus BLEU sufficient statistics plus running METEOR/ROUGE sums."""
+
+    def __init__(self, max_order=4):
+        self.max_order = max_order
+        self.matches = [0] * max_order
+        self.totals = [0] * max_order
+        self.hyp_len = 0
+        self.ref_len = 0
+        self.meteor = 0.0
+        self.rouge = {'rouge1': 0.0, 'rouge2': 0.0, 'rougeL': 0.0}
+        self.n = 0
+
+    def update(self, gt_tokens, out_tokens, meteor, rouge_scores):
+        for order in range(1, self.max_order + 1):
+            hyp_ngrams = Counter(tuple(out_tokens[i:i + order]) for i in range(len(out_tokens) - order + 1))
+            ref_ngrams = Counter(tuple(gt_tokens[i:i + order]) for i in range(len(gt_tokens) - order + 1))
+            self.matches[order - 1] += sum(min(c, ref_ngrams[g]) for g, c in hyp_ngrams.items())
+            self.totals[order - 1] += max(1, len(out_tokens) - order + 1)
+        self.hyp_len += len(out_tokens)
+        self.ref_len += len(gt_tokens)
+        self.meteor += meteor
+        for key in self.rouge:
+            self.rouge[key] += rouge_scores[key]
+        self.n += 1
+
+    def bleu(self, weights):
+        """Same result as nltk corpus_bleu without smoothing for a single reference per row."""
+        if self.hyp_len == 0:
+            return 0.0
+        if any(self.matches[i] == 0 for i in range(len(weights))):
+            return 0.0
+        log_precision = sum(w * math.log(self.matches[i] / self.totals[i]) for i, w in enumerate(weights))
+        bp = 1.0 if self.hyp_len > self.ref_len else math.exp(1 - self.ref_len / self.hyp_len)
+        return bp * math.exp(log_precision)
+
+    def report(self):
+        n = max(self.n, 1)
+        return (
+            f"rows={self.n} BLEU-2={self.bleu((.5, .5))*100:.1f} BLEU-4={self.bleu((.25, .25, .25, .25))*100:.1f} "
+            f"ROUGE-1={self.rouge['rouge1']/n*100:.1f} ROUGE-2={self.rouge['rouge2']/n*100:.1f} "
+            f"ROUGE-L={self.rouge['rougeL']/n*100:.1f} METEOR={self.meteor/n*100:.1f}"
+        )
+
+def parse_yes(prediction):
+    return 1.0 if 'yes' in prediction.lower().split('answer:')[-1] else 0.0
+
+def run_auroc(rows, args):
+    metrics = StreamingAUROC()
+    for row in rows:
+        prediction = row.get(args.out_column)
+        if prediction is None:
+            continue
+        score = float(row[args.score_column]) if args.score_column else parse_yes(prediction)
+        metrics.update(row[args.label_column] == 'Yes.', score)
+        if metrics.n % args.report_every == 0:
+            print(metrics.report(), flush=True)
+    print(metrics.report())
+    return metrics
+
+def run_caption(rows, args):
+    from transformers import BertTokenizerFast
+    from rouge_score import rouge_scorer
+    from nltk.translate.meteor_score import meteor_score
+    from evaluate import batch_tokenize, extract_output
+
+    text_tokenizer = BertTokenizerFast.from_pretrained(args.text_model)
+    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'])
+    metrics = StreamingCaptionMetrics()
+
+    def flush(batch):
+        gts = [row['description'] for row in batch]
+        outs = [extract_output(row[args.out_column], args.reasoning) for row in batch]
+        gt_tokens = batch_tokenize(text_tokenizer, gts, args.text_trunc_length)
+        out_tokens = batch_tokenize(text_tokenizer, outs, args.text_trunc_length)
+        for gt, out, gt_t, out_t in zip(gts, outs, gt_tokens, out_tokens):
+            rs = scorer.score(out, gt)
+            metrics.update(gt_t, out_t, meteor_score([gt_t], out_t), {k: v.fmeasure for k, v in rs.items()})
+            if metrics.n % args.report_every == 0:
+                print(metrics.report(), flush=True)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == args.batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    print(metrics.report())
+    return metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report running metrics while a prediction file is still being written.")
+    parser.add_argument('--dataset_path', type=str, required=True, help='prediction jsonl, e.g. the output of generate_vllm_online.py --save_per_row')
+    parser.add_argument('--task', type=str, default='auroc', choices=['auroc', 'caption'], help='classification (AUROC/accuracy) or captioning (BLEU/ROUGE/METEOR)')
+    parser.add_argument('--out_column', type=str, default='llm_response', help='column with the model output')
+    parser.add_argument('--label_column', type=str, default='result', help='column with the Yes./No. label for --task auroc')
+    parser.add_argument('--score_column', type=str, default=None, help='column with P(YES) for --task auroc; parsed from the output when unset')
+    parser.add_argument('--report_every', type=int, default=100, help='print running metrics every N rows')
+    parser.add_argument('--follow', action='store_true', help='keep reading as the file grows')
+    parser.add_argument('--poll_interval', type=float, default=2.0, help='seconds between checks for new rows with --follow')
+    parser.add_argument('--idle_timeout', type=float, default=600.0, help='stop following after this many seconds without new rows')
+    parser.add_argument('--text_model', type=str, default='allenai/scibert_scivocab_uncased', help='tokenizer for --task caption')
+    parser.add_argument('--text_trunc_length', type=int, default=512, help='tokenizer maximum length')
+    parser.add_argument('--reasoning', action='store_true', help='score only the text after "final description:"')
+    parser.add_argument('--batch_size', type=int, default=64, help='rows tokenized together for --task caption')
+    args = parser.parse_args()
+
+    rows = follow_jsonl(args.dataset_path, args.follow, args.poll_interval, args.idle_timeout)
+    if args.task == 'auroc':
+        run_auroc(rows, args)
+    else:
+        run_caption(rows, args)
@@ -1,12 +1,19 @@
-import json
 import asyncio
 import logging
 from pathlib import Path
 import argparse
 import os
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, Optional, List, Tuple
 from openai import AsyncOpenAI, APIError
 from tqdm.asyncio import tqdm_asyncio
+from adaptive_limiter import AdaptiveLimiter, is_overload_error
+from jsonl_io import dumps
+from columnar_io import iter_rows
+from response_cache import ResponseCache
+from molecule_index import load_id_to_key
+from request_metrics import RequestMetrics, new_stats, fill_stats
+from early_stop import EarlyStop, has_answer_line
 
 # --- Prompts (as requested by user) ---
 PROMPT_TEMPLATES = {
@@ -30,50 +37,168 @@ SELFIES: {selfies}
 """
 }
 
+SAMPLING_PARAMS = {"max_tokens": 100000, "reasoning_effort": "high", "temperature": 0.8}
+
 # --- Core Functions ---
 
+def prompt_messages(prompt: str):
+    return [{"role": "user", "content": prompt}]
+
 async def get_llm_response(
     prompt: str,
     session: AsyncOpenAI,
     model_name: str,
+    limiter: Optional[AdaptiveLimiter] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    early_stop: Optional[EarlyStop] = None,
 ) -> Optional[str]:
+    stats = new_stats() if stats is None else stats
+    start = time.monotonic()
     try:
-        messages = [{"role": "user", "content": prompt}]
-        response = await session.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            max_tokens=100000,
-            reasoning_effort='high',
-            temperature=0.8,
-        )
-        return response.choices[0].message.content
+        if early_stop is not None:
+            texts, tokens, cut = await early_stop.create(session, stats, model=model_name, messages=prompt_messages(prompt), **SAMPLING_PARAMS)
+            # A trace cut at the length cap has no answer to check.
+            content = texts[0] if not cut[0] or has_answer_line(texts[0]) else None
+        else:
+            raw = await session.chat.completions.with_raw_response.create(
+                model=model_name,
+                messages=prompt_messages(prompt),
+                **SAMPLING_PARAMS,
+            )
+            response = raw.parse()
+            fill_stats(stats, start, response.usage, raw.retries_taken)
+            tokens = response.usage.completion_tokens if response.usage else None
+            content = response.choices[0].message.content
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, tokens=tokens, retries=stats["retries"])
+        return content
     except APIError as e:
         logging.error(f"API Error occurred: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False, overloaded=is_overload_error(e))
     except Exception as e:
         logging.error(f"An unexpected error occurred during API call: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False)
     return None
 
+async def get_llm_choices(
+    prompt: str,
+    session: AsyncOpenAI,
+    model_name: str,
+    n: int,
+    limiter: Optional[AdaptiveLimiter] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    early_stop: Optional[EarlyStop] = None,
+    accept=None,
+    max_tokens: Optional[int] = None,
+) -> Tuple[List[str], int]:
+    """
+    Requests `n` completions in one call. Returns the contents and the completion tokens spent.
+    With `early_stop`, the stream is closed as soon as `accept` holds for any choice.
+    `max_tokens` lowers the per-choice limit of SAMPLING_PARAMS.
+    """
+    params = SAMPLING_PARAMS if max_tokens is None else {**SAMPLING_PARAMS, "max_tokens": max_tokens}
+    stats = new_stats() if stats is None else stats
+    start = time.monotonic()
+    try:
+        if early_stop is not None:
+            texts, tokens, cut = await early_stop.create(session, stats, accept, model=model_name, messages=prompt_messages(prompt), n=n, **params)
+            # Choices cut before their answer line are incomplete.
+            contents = [text for text, was_cut in zip(texts, cut) if not was_cut or has_answer_line(text)]
+        else:
+            raw = await session.chat.completions.with_raw_response.create(
+                model=model_name,
+                messages=prompt_messages(prompt),
+                n=n,
+                **params,
+            )
+            response = raw.parse()
+            fill_stats(stats, start, response.usage, raw.retries_taken)
+            tokens = response.usage.completion_tokens if response.usage else 0
+            contents = [choice.message.content for choice in response.choices]
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, tokens=tokens // n if tokens else None, retries=stats["retries"])
+        return [content for content in contents if content], tokens
+    except APIError as e:
+        logging.error(f"API Error occurred: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False, overloaded=is_overload_error(e))
+    except Exception as e:
+        logging.error(f"An unexpected error occurred during API call: {e}")
+        fill_stats(stats, start, status=type(e).__name__)
+        if limiter is not None:
+            limiter.record(time.monotonic() - start, success=False)
+    return [], 0
+
+def is_correct(llm_output: Optional[str], expected_result: str) -> bool:
+    return bool(llm_output) and expected_result.lower().split('.')[0] in llm_output.lower().split('answer:')[-1].strip()
+
+def cached_answer(cache: Optional[ResponseCache], prompt: str, model_name: str, expected_result: str) -> Optional[str]:
+    """
+    Only answers that passed the label check are cached, so a hit can be accepted directly.
+    An accepted answer stays valid at any sampling temperature, so the cache's temperature
+    limit is bypassed.
+    """
+    if cache is None:
+        return None
+    cached = cache.get(model_name, prompt_messages(prompt), SAMPLING_PARAMS, force=True)
+    return cached if is_correct(cached, expected_result) else None
+
+def fan_out(output_data: Dict[str, Any], task_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The result row for the queried item plus one per duplicate of the same molecule (see molecule_index.py)."""
+    rows = [output_data]
+    for duplicate in task_info.get("duplicates", []):
+        rows.append({**output_data, "id": duplicate["id"], "prompt": duplicate["prompt"], "dedup_of": output_data["id"]})
+    return rows
+
+def group_duplicates(tasks: List[Dict[str, Any]], id_to_key: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Keeps one task per (molecule, label); the others ride along as its duplicates."""
+    groups = {}
+    for task in tasks:
+        group_key = (id_to_key.get(task["id"], task["id"]), task["result"])
+        if group_key in groups:
+            groups[group_key].setdefault("duplicates", []).append({"id": task["id"], "prompt": task["prompt"]})
+        else:
+            groups[group_key] = task
+    return list(groups.values())
+
 async def process_and_update_item(
     task_info: Dict[str, Any],
     session: AsyncOpenAI,
-    semaphore: asyncio.Semaphore,
+    semaphore,
     model_name: str,
     output_file: str,
     lock: asyncio.Lock,
+    cache: Optional[ResponseCache] = None,
+    metrics: Optional[RequestMetrics] = None,
+    early_stop: Optional[EarlyStop] = None,
 ):
+    created = time.monotonic()
     async with semaphore:
+        queue_wait = time.monotonic() - created
         prompt = task_info["prompt"]
         expected_result = task_info["result"]
         item_id = task_info["id"]
 
-        llm_output = None
+        limiter = semaphore if isinstance(semaphore, AdaptiveLimiter) else None
+        llm_output = cached_answer(cache, prompt, model_name, expected_result)
         attempt = 0
-        while True:
+        while llm_output is None or not is_correct(llm_output, expected_result):
             attempt += 1
-            llm_output = await get_llm_response(prompt, session, model_name)
+            stats = new_stats() if metrics is not None else None
+            llm_output = await get_llm_response(prompt, session, model_name, limiter, stats, early_stop)
+            if metrics is not None:
+                # Only the first attempt waited for a slot; retries keep theirs.
+                metrics.record(item_id, queue_wait if attempt == 1 else 0.0, stats, attempt=attempt, accepted=is_correct(llm_output, expected_result))
 
-            if llm_output and expected_result.lower().split('.')[0] in llm_output.lower().split('answer:')[-1].strip():
+            if is_correct(llm_output, expected_result):
                 logging.info(f"Correct answer received for {item_id} on attempt {attempt}.")
+                if cache is not None:
+                    cache.put(model_name, prompt_messages(prompt), SAMPLING_PARAMS, llm_output, force=True)
                 break
             
             logging.warning(f"Incorrect answer for {item_id} (attempt {attempt}). LLM output: {llm_output}. Expected: {expected_result}")
@@ -92,7 +217,98 @@ async def process_and_update_item(
         
         async with lock:
             with open(output_file, "a") as f:
-                f.write(json.dumps(output_data) + "\n")
+                for row in fan_out(output_data, task_info):
+                    f.write(dumps(row) + "\n")
+
+async def process_item_multi_sample(
+    task_info: Dict[str, Any],
+    session: AsyncOpenAI,
+    semaphore,
+    model_name: str,
+    output_file: str,
+    dead_letter_file: str,
+    lock: asyncio.Lock,
+    num_samples: int,
+    max_samples: int,
+    max_attempts: int,
+    max_item_tokens: int,
+    min_sample_tokens: int,
+    cache: Optional[ResponseCache] = None,
+    metrics: Optional[RequestMetrics] = None,
+    early_stop: Optional[EarlyStop] = None,
+):
+    """
+    Rejection sampling with `n` choices per call. The number of choices doubles
+    every round up to `max_samples`, and the item is given up once it exceeds
+    `max_attempts` calls or `max_item_tokens` completion tokens. Every call is
+    clamped to the remaining budget: fewer choices and a lower max_tokens, with at
+    least `min_sample_tokens` per choice.
+    """
+    created = time.monotonic()
+    async with semaphore:
+        queue_wait = time.monotonic() - created
+        prompt = task_info["prompt"]
+        expected_result = task_info["result"]
+        item_id = task_info["id"]
+
+        limiter = semaphore if isinstance(semaphore, AdaptiveLimiter) else None
+        accepted = cached_answer(cache, prompt, model_name, expected_result)
+        tokens_used = 0
+        samples_drawn = 0
+        attempt = 0
+        n = num_samples
+        while accepted is None and attempt < max_attempts:
+            call_n, max_tokens = n, None
+            if max_item_tokens > 0:
+                remaining = max_item_tokens - tokens_used
+                call_n = min(n, remaining // max(min_sample_tokens, 1))
+                if call_n < 1:
+                    break
+                max_tokens = min(SAMPLING_PARAMS["max_tokens"], remaining // call_n)
+            attempt += 1
+            stats = new_stats() if metrics is not None else None
+            choices, tokens = await get_llm_choices(
+                prompt, session, model_name, call_n, limiter, stats, early_stop, lambda text: is_correct(text, expected_result), max_tokens,
+            )
+            tokens_used += tokens
+            samples_drawn += len(choices)
+
+            accepted = next((c for c in choices if is_correct(c, expected_result)), None)
+            if metrics is not None:
+                metrics.record(item_id, queue_wait if attempt == 1 else 0.0, stats, attempt=attempt, n=call_n, accepted=accepted is not None)
+            if accepted is not None:
+                logging.info(f"Correct answer received for {item_id} on attempt {attempt} ({samples_drawn} samples, {tokens_used} tokens).")
+                if cache is not None:
+                    cache.put(model_name, prompt_messages(prompt), SAMPLING_PARAMS, accepted, force=True)
+                break
+
+            logging.warning(f"No correct answer for {item_id} among {len(choices)} samples (attempt {attempt}). Expected: {expected_result}")
+            n = min(max_samples, n * 2)
+
+        if accepted is not None:
+            output_data = {
+                "id": item_id,
+                "llm_output": accepted,
+                "expected_result": expected_result,
+                "prompt": prompt,
+            }
+            path = output_file
+        else:
+            logging.error(f"Budget exhausted for {item_id} after {attempt} attempts and {tokens_used} tokens.")
+            output_data = {
+                "id": item_id,
+                "expected_result": expected_result,
+                "prompt": prompt,
+                "attempts": attempt,
+                "samples": samples_drawn,
+                "tokens_used": tokens_used,
+            }
+            path = dead_letter_file
+
+        async with lock:
+            with open(path, "a") as f:
+                for row in fan_out(output_data, task_info):
+                    f.write(dumps(row) + "\n")
 
 async def main(args):
     # --- Logging Setup ---
@@ -108,7 +324,7 @@ async def main(args):
     tasks_to_run = []
     input_files = []
     if os.path.isdir(args.input_path):
-        for ext in ('*.json', '*.jsonl'):
+        for ext in ('*.json', '*.jsonl', '*.parquet'):
             input_files.extend(Path(args.input_path).rglob(ext))
     else:
         input_files.append(Path(args.input_path))
@@ -116,25 +332,23 @@ async def main(args):
     prompt_template = PROMPT_TEMPLATES.get(args.prompt_name, PROMPT_TEMPLATES["default"])
 
     for file_path in input_files:
-        with open(file_path, "r") as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    prompt_text = data.get(args.prompt_key)
-                    result = data.get("result")
-                    item_id = data.get("id")
-                    if prompt_text and result and item_id:
-                        tasks_to_run.append({
-                            "prompt": prompt_template.format(selfies=prompt_text),
-                            "input_file": str(file_path),
-                            "result": result,
-                            "id": item_id,
-                        })
-                except (json.JSONDecodeError, KeyError) as e:
-                    logging.error(f"Skipping line in {file_path} due to error: {e}")
-                    continue
+        for data in iter_rows(str(file_path), [args.prompt_key, "result", "id"]):
+            prompt_text = data.get(args.prompt_key)
+            result = data.get("result")
+            item_id = data.get("id")
+            if prompt_text and result and item_id:
+                tasks_to_run.append({
+                    "prompt": prompt_template.format(selfies=prompt_text),
+                    "input_file": str(file_path),
+                    "result": result,
+                    "id": item_id,
+                })
 
     logging.info(f"Found {len(tasks_to_run)} entries to process.")
+    if args.molecule_index:
+        num_entries = len(tasks_to_run)
+        tasks_to_run = group_duplicates(tasks_to_run, load_id_to_key(args.molecule_index))
+        logging.info(f"Querying {len(tasks_to_run)} unique molecules; {num_entries - len(tasks_to_run)} duplicates reuse their results.")
     if not tasks_to_run:
         return
 
@@ -148,14 +362,42 @@ async def main(args):
         os.makedirs(output_dir, exist_ok=True)
 
     async_client = AsyncOpenAI(base_url=args.api_base_url, api_key=args.api_key)
-    semaphore = asyncio.Semaphore(args.semaphore_limit)
+    if args.adaptive_concurrency:
+        semaphore = AdaptiveLimiter(initial_limit=args.initial_concurrency, max_limit=args.semaphore_limit)
+    else:
+        semaphore = asyncio.Semaphore(args.semaphore_limit)
 
-    async_tasks = [
-        process_and_update_item(task_info, async_client, semaphore, args.model_name, args.output_file, lock)
-        for task_info in tasks_to_run
-    ]
+    cache = ResponseCache(args.cache_path, args.cache_max_bytes) if args.cache_path else None
+    metrics = RequestMetrics(args.metrics_path, args.metrics_log_interval) if args.metrics_path or args.report_metrics else None
+    early_stop = EarlyStop(args.max_response_chars) if args.early_stop else None
+
+    if args.num_samples > 0:
+        dead_letter_file = args.dead_letter_file or os.path.splitext(args.output_file)[0] + "_dead_letter.jsonl"
+        if os.path.exists(dead_letter_file):
+            os.remove(dead_letter_file)
+        async_tasks = [
+            process_item_multi_sample(
+                task_info, async_client, semaphore, args.model_name, args.output_file, dead_letter_file, lock,
+                args.num_samples, max(args.num_samples, args.max_samples), args.max_attempts, args.max_item_tokens, args.min_sample_tokens, cache, metrics, early_stop,
+            )
+            for task_info in tasks_to_run
+        ]
+    else:
+        async_tasks = [
+            process_and_update_item(task_info, async_client, semaphore, args.model_name, args.output_file, lock, cache, metrics, early_stop)
+            for task_info in tasks_to_run
+        ]
 
     await tqdm_asyncio.gather(*async_tasks, desc="Sending requests to LLM")
+    if args.adaptive_concurrency:
+        logging.info(semaphore.summary())
+    if cache is not None:
+        logging.info(cache.summary())
+    if early_stop is not None:
+        logging.info(early_stop.summary())
+    if metrics is not None:
+        logging.info(metrics.summary())
+        metrics.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Process text files with an LLM asynchronously with rejection sampling.")
@@ -163,7 +405,9 @@ if __name__ == '__main__':
     parser.add_argument("--model_name", type=str, default="gpt-oss-120b", help="Name of the model to use.")
     parser.add_argument("--api_base_url", type=str, default="http://localhost:8000/v1/", help="API base URL for the LLM.")
     parser.add_argument("--api_key", type=str, default="EMPTY", help="API key for the LLM.")
-    parser.add_argument("--semaphore_limit", type=int, default=200, help="Concurrency limit for API requests.")
+    parser.add_argument("--semaphore_limit", type=int, default=200, help="Concurrency limit for API requests (upper bound with --adaptive_concurrency).")
+    parser.add_argument("--adaptive_concurrency", action="store_true", help="Adjust the number of in-flight requests from observed latency and errors (AIMD).")
+    parser.add_argument("--initial_concurrency", type=int, default=16, help="Starting concurrency for --adaptive_concurrency.")
     
     parser.add_argument("--input_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/original/bbbp_train.jsonl", help="Path to an input file or directory containing .json/.jsonl files.")
     parser.add_argument("--output_file", type=str, default="output2.jsonl", help="Path to save the output jsonl file.")
@@ -172,5 +416,22 @@ if __name__ == '__main__':
     parser.add_argument("--prompt_name", type=str, default="default", help="Name of the prompt template to use.")
     parser.add_argument("--prompt_key", type=str, default="SELFIES", help="The key in the JSON to use for the prompt's input.")
 
+    parser.add_argument("--cache_path", type=str, default=None, help="SQLite file caching accepted answers across runs, at any temperature: a cached answer for a prompt is reused instead of sampling again. Disabled when unset.")
+    parser.add_argument("--cache_max_bytes", type=int, default=2 * 1024 ** 3, help="Evict least recently used answers beyond this size.")
+
+    parser.add_argument("--metrics_path", type=str, default=None, help="Sidecar jsonl with one line per request: queue wait, TTFT, latency, token usage, retries, attempt.")
+    parser.add_argument("--report_metrics", action="store_true", help="Log the live and end-of-run request summary even without --metrics_path.")
+    parser.add_argument("--metrics_log_interval", type=float, default=30.0, help="Seconds between live summaries.")
+    parser.add_argument("--early_stop", action="store_true", help="Stream completions and cancel each request once its ANSWER line arrives (with --num_samples, once a choice passes the label check).")
+    parser.add_argument("--max_response_chars", type=int, default=0, help="With --early_stop, also cancel a choice once its reasoning plus content exceed this many characters (0 for no limit).")
+    parser.add_argument("--molecule_index", type=str, default=None, help="Index from molecule_index.py. Each unique molecule is queried once and its result written for every duplicate id.")
+
+    parser.add_argument("--num_samples", type=int, default=0, help="Choices requested per call (n). 0 keeps the original one-at-a-time retry loop.")
+    parser.add_argument("--max_samples", type=int, default=16, help="Upper bound on n as it doubles over rounds.")
+    parser.add_argument("--max_attempts", type=int, default=4, help="Maximum number of calls per item with --num_samples.")
+    parser.add_argument("--max_item_tokens", type=int, default=400000, help="Completion token budget per item with --num_samples (0 for no limit).")
+    parser.add_argument("--min_sample_tokens", type=int, default=2048, help="Smallest per-choice max_tokens worth requesting; the item stops once its remaining budget is below this.")
+    parser.add_argument("--dead_letter_file", type=str, default=None, help="Where items that exhaust their budget are written. Defaults to <output_file>_dead_letter.jsonl.")
+
     args = parser.parse_args()
     asyncio.run(main(args))
@@ -1,11 +1,12 @@
+import os
 import json
+import hashlib
 import argparse
-from datasets import load_dataset, Dataset
+from itertools import islice
 from tqdm import tqdm
+from jsonl_io import read_jsonl
 
-def create_batch_file(dataset, output_filename, input_column, id_column, gt_given):
-    
-    system_prompt = """You are a chemical domain expert specializing in molecular property prediction.
+SYSTEM_PROMPT = """You are a chemical domain expert specializing in molecular property prediction.
 You will be provided with a SELFIES representation of a molecule and a ground truth answer.
 Your task is to give a detailed reasoning and determine if the given molecule functions as an inhibitor of the human immunodeficiency virus (HIV).
 
@@ -20,30 +21,103 @@ After your reasoning, insert a new line.
 On the following line, present your conclusion in the exact format of "ANSWER: YES", if the molecule can inhibit HIV replication, and "ANSWER: NO" if it cannot.
 """.strip()
 
-    jobs = []
-    
-    for row in tqdm(dataset):
-        job = {
-            "custom_id": row['id'],
-            "method": "POST",
-            "url": "/v1/chat/completions",
-            "body": {
-                "model": "gpt-4.1",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "SELFIES: "+row['SELFIES']+'\nGT Answer: '+row['result'][:-1].upper() if gt_given else row[input_column]}
-                ],
-                "temperature": 1,
-                "top_p": 1,
-            }
+def build_job(row, input_column, id_column, gt_given):
+    return {
+        "custom_id": row[id_column],
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": "gpt-4.1",
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": "SELFIES: "+row['SELFIES']+'\nGT Answer: '+row['result'][:-1].upper() if gt_given else row[input_column]}
+            ],
+            "temperature": 1,
+            "top_p": 1,
         }
-        jobs.append(job)
+    }
+
+def job_content_hash(job):
+    """Hash of what the model sees, so the same prompt is recognized under any custom_id."""
+    body = job["body"]
+    payload = json.dumps({"model": body["model"], "messages": body["messages"]}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_accepted_hashes(accepted_paths, input_column, id_column, gt_given):
+    """Rebuilds the jobs behind rows of accepted output files (rejection_save.py output) and hashes them."""
+    return {
+        job_content_hash(build_job(row, input_column, id_column, gt_given))
+        for path in accepted_paths
+        for row in read_jsonl(path)
+    }
+
+class ShardWriter:
+    """
+    Writes jobs to `output_filename`, rolling over to numbered shards when the Batch API
+    per-file request or byte limit would be exceeded, and records a manifest of shard -> ids.
+    """
+
+    def __init__(self, output_filename, max_requests, max_bytes):
+        self.stem = os.path.splitext(output_filename)[0]
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.num_jobs = 0
+        self._f = None
+        self._open(output_filename)
+
+    def _open(self, path):
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._f = open(path, "wb")
+        self.shards.append({"path": path, "num_requests": 0, "bytes": 0, "ids": []})
 
-    with open(output_filename, 'w') as f:
-        for job in tqdm(jobs, desc=f"Writing {len(jobs)} jobs to {output_filename}"):
-            f.write(json.dumps(job) + '\n')
-            
-    return len(jobs)
+    def _roll_over(self):
+        self._f.close()
+        if len(self.shards) == 1:
+            # More than one shard after all: give the first one a part name too.
+            first = self.shards[0]
+            renamed = f"{self.stem}_part000.jsonl"
+            os.replace(first["path"], renamed)
+            first["path"] = renamed
+        self._open(f"{self.stem}_part{len(self.shards):03d}.jsonl")
+
+    def write(self, job):
+        line = (json.dumps(job) + '\n').encode("utf-8")
+        shard = self.shards[-1]
+        if shard["num_requests"] and (shard["num_requests"] >= self.max_requests or shard["bytes"] + len(line) > self.max_bytes):
+            self._roll_over()
+            shard = self.shards[-1]
+        self._f.write(line)
+        shard["num_requests"] += 1
+        shard["bytes"] += len(line)
+        shard["ids"].append(job["custom_id"])
+        self.num_jobs += 1
+
+    def close(self):
+        self._f.close()
+        manifest_path = f"{self.stem}_manifest.json"
+        with open(manifest_path, 'w') as f:
+            json.dump({"num_jobs": self.num_jobs, "shards": self.shards}, f, indent=2)
+        for shard in self.shards:
+            print(f"Wrote {shard['num_requests']} jobs ({shard['bytes'] / 1e6:.1f} MB) to {shard['path']}")
+        print(f"Manifest: {manifest_path}")
+
+def create_batch_file(dataset, output_filename, input_column, id_column, gt_given, max_requests=50000, max_bytes=190 * 1024 * 1024, accepted_hashes=None):
+    writer = ShardWriter(output_filename, max_requests, max_bytes)
+    skipped = 0
+    for row in tqdm(dataset):
+        job = build_job(row, input_column, id_column, gt_given)
+        if accepted_hashes and job_content_hash(job) in accepted_hashes:
+            skipped += 1
+            continue
+        writer.write(job)
+    writer.close()
+
+    if skipped:
+        print(f"Skipped {skipped} jobs whose prompts already produced accepted reasoning.")
+    return writer.num_jobs
 
 def main():
     """Main function to run the data generation process."""
@@ -55,12 +129,17 @@ def main():
     parser.add_argument("--start_idx", type=int, default=0, help="Number of user_ids to process. Processes all users by default if not specified.")
     parser.add_argument("--end_idx", type=int, default=-1, help="Number of user_ids to process. Processes all users by default if not specified.")
     parser.add_argument("--gt_type", type=str, default="gt_given", help="Number of user_ids to process. Processes all users by default if not specified.")
+    parser.add_argument("--max_requests_per_file", type=int, default=50000, help="Batch API request limit per input file.")
+    parser.add_argument("--max_bytes_per_file", type=int, default=190 * 1024 * 1024, help="Batch API size limit per input file, with some headroom.")
+    parser.add_argument("--accepted_paths", type=str, nargs='*', default=[], help="Accepted outputs of earlier rounds (rejection_save.py output). Prompts that already produced them are not resubmitted.")
     args = parser.parse_args()
 
-    dataset = Dataset.from_json(args.input_data_path)
-    dataset = dataset.select(range(args.start_idx,args.end_idx if args.end_idx>0 else len(dataset)))
-    
-    num_jobs_created = create_batch_file(dataset, args.output_data_path, args.input_column, args.id_column, args.gt_type=='gt_given')
+    gt_given = args.gt_type=='gt_given'
+    dataset = islice(read_jsonl(args.input_data_path), args.start_idx, args.end_idx if args.end_idx>0 else None)
+    accepted_hashes = load_accepted_hashes(args.accepted_paths, args.input_column, args.id_column, gt_given) if args.accepted_paths else None
+
+    num_jobs_created = create_batch_file(dataset, args.output_data_path, args.input_column, args.id_column, gt_given,
+                                         args.max_requests_per_file, args.max_bytes_per_file, accepted_hashes)
     
     print(f"\nSuccessfully created batch.jsonl with {num_jobs_created} API requests.")
 
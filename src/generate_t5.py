@@ -1,31 +1,57 @@
 import argparse
+import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 from datasets import Dataset
 from tqdm import tqdm
 import json
+from offline_scheduler import length_bucketed_batches
+from jsonl_io import load_done_ids
+
+def clean_output(output_text, tokenizer):
+    output_text = output_text.split(tokenizer.eos_token)[0]
+    output_text = output_text.replace(tokenizer.pad_token, "")
+    return output_text.strip()
 
 def main(args):
-    model = AutoModelForSeq2SeqLM.from_pretrained(args.model_path).to('cuda')
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    device = torch.device(args.device if args.device else ("cuda" if torch.cuda.is_available() else "cpu"))
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(args.model_path).to(device)
+    model.eval()
     tokenizer = AutoTokenizer.from_pretrained(args.model_path)
 
     dataset = Dataset.from_json(args.dataset_path)
+    data_list = dataset.to_list()
 
-    with open(args.save_path, 'w') as out_f:
-        for k in tqdm(dataset, desc="Processing"):
-            instance = k['SMILES']
-            # input_text = 
-            input_text = f"Caption the following molecule: {instance}" if args.prompt else f"{instance}"
+    if args.resume:
+        # An id of 0 or "" is still an id; SMILES is the key only when some row has none.
+        key = 'SMILES' if any(k.get('id') is None for k in data_list) else 'id'
+        done = load_done_ids(args.save_path, key=key)
+        data_list = [k for k in data_list if k[key] not in done]
+        print(f"Resuming: {len(done)} rows already in {args.save_path}, {len(data_list)} left.")
 
-            text = tokenizer(input_text, return_tensors="pt").to('cuda')
-            output = model.generate(input_ids=text["input_ids"], max_length=2048)
-            output_text = tokenizer.decode(output[0].cpu())
+    input_texts = [f"Caption the following molecule: {k['SMILES']}" if args.prompt else f"{k['SMILES']}" for k in data_list]
+    lengths = [len(ids) for ids in tokenizer(input_texts)["input_ids"]]
+    # The budget covers padded input tokens; decoder length is bounded separately by --max_length.
+    batches = [
+        batch[i:i + args.max_batch_size]
+        for batch in length_bucketed_batches(lengths, 0, args.max_batch_tokens)
+        for i in range(0, len(batch), args.max_batch_size)
+    ]
 
-            output_text = output_text.split(tokenizer.eos_token)[0]
-            output_text = output_text.replace(tokenizer.pad_token, "")
-            output_text = output_text.strip()
+    with open(args.save_path, 'a' if args.resume else 'w') as out_f:
+        for batch in tqdm(batches, desc="Processing"):
+            inputs = tokenizer([input_texts[i] for i in batch], return_tensors="pt", padding=True).to(device)
+            with torch.no_grad():
+                output = model.generate(**inputs, max_length=args.max_length)
+            output_texts = tokenizer.batch_decode(output.cpu())
 
-            k['prediction'] = output_text
-            out_f.write(json.dumps(k) + '\n')
+            for i, output_text in zip(batch, output_texts):
+                k = data_list[i]
+                k['prediction'] = clean_output(output_text, tokenizer)
+                out_f.write(json.dumps(k) + '\n')
+            out_f.flush()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate predictions from SMILES strings using a transformer model.")
@@ -33,6 +59,12 @@ if __name__ == "__main__":
     parser.add_argument("--save_path", type=str, default='/home/tkdrnjs0621/work/kmel-reasoning/dataset/test/baselines/out_molt5-large.jsonl', help="Path to output JSONL file.")
     parser.add_argument("--model_path", type=str, default="laituan245/molt5-large-smiles2caption", help="Pretrained model name or path.")
     parser.add_argument("--prompt", action='store_true')
+    parser.add_argument("--device", type=str, default=None, help="Device to run on. Defaults to cuda when available, otherwise cpu.")
+    parser.add_argument("--max_length", type=int, default=2048, help="Maximum generated sequence length.")
+    parser.add_argument("--max_batch_tokens", type=int, default=8192, help="Budget for batch_size * longest input in the batch.")
+    parser.add_argument("--max_batch_size", type=int, default=64, help="Upper bound on rows per batch.")
+    parser.add_argument("--resume", action='store_true', help="Append to --save_path and skip rows already in it (keyed by id, or by SMILES when some row has no id).")
+    parser.add_argument("--num_threads", type=int, default=0, help="torch CPU thread count (0 keeps the torch default).")
 
     args = parser.parse_args()
     main(args)
@@ -5,6 +5,9 @@ from tqdm import tqdm
 import torch
 import argparse
 import json
+from prefix_cache import PrefixCache, system_prompt_key
+from chat_format import read_chat_jsonl
+from offline_scheduler import length_bucketed_batches
 
 def apply_chat_template_internLM(input_ls):
     txt=""
@@ -15,42 +18,92 @@ def apply_chat_template_internLM(input_ls):
     txt+="<|im_start|>assistant\n"
     return txt
 
+def build_prompt(messages, tokenizer, chat_template):
+    if chat_template == "internlm":
+        return apply_chat_template_internLM(messages)
+    return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Full Run")
     parser.add_argument("--model_path", type=str, default="/home/tkdrnjs0621/work/dsail-k-melloddy/reasoning/LLaMA-Factory/saves/llama3.1-8b/sft_full", help="model name for evaluation")
     parser.add_argument("--dataset_path", type=str, default="/home/tkdrnjs0621/work/newkmel/dataset/test/test-zs-vanilla.jsonl", help="path to dataset")
     parser.add_argument("--save_path", type=str, default="newnewnewrs.jsonl", help="output save path")
+    parser.add_argument("--chat_template", type=str, default="internlm", choices=["internlm", "hf"], help="internlm uses apply_chat_template_internLM, hf uses tokenizer.apply_chat_template")
+    parser.add_argument("--max_new_tokens", type=int, default=2048, help="maximum number of generated tokens")
+    parser.add_argument("--max_batch_tokens", type=int, default=16384, help="budget for batch_size * (longest prompt + max_new_tokens)")
+    parser.add_argument("--reuse_prefix_cache", action='store_true', help="prefill the shared system prompt once per prompt type and generate row by row from its cache")
 
     args = parser.parse_args()
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     tokenizer = AutoTokenizer.from_pretrained(args.model_path, trust_remote_code=True)
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
     model = AutoModelForCausalLM.from_pretrained(args.model_path, trust_remote_code=True).to(device)
     model.eval()
 
-    dataset = Dataset.from_json(args.dataset_path)
+    dataset = Dataset.from_list(list(read_chat_jsonl(args.dataset_path)))
+    data_list = dataset.to_list()
+
+    prompts = [build_prompt(example["messages"], tokenizer, args.chat_template) for example in data_list]
+    # The hf template already starts with BOS; the internlm one relies on the tokenizer adding it.
+    add_special_tokens = args.chat_template != "hf"
+    input_ids_list = tokenizer(prompts, add_special_tokens=add_special_tokens)["input_ids"]
 
+    # Batches finish in length order; rows are buffered by input index and the finished
+    # prefix is written after every batch, so the file keeps input order and a crash keeps it.
     with open(args.save_path, 'w', encoding='utf-8') as f:
-        for example in tqdm(dataset):
-            # prompt = tokenizer.apply_chat_template(
-            #     example["messages"],
-            #     tokenize=False,
-            #     add_generation_prompt=True
-            # )
-            prompt = apply_chat_template_internLM(example["messages"])
-
-            inputs = tokenizer(prompt, return_tensors="pt").to(device)
-
-            with torch.no_grad():
-                output_ids = model.generate(
-                    **inputs,
-                    max_new_tokens=2048,
-                    temperature=0.0,
-                    do_sample=False,
-                    pad_token_id=tokenizer.eos_token_id
-                )
-
-            output_text = tokenizer.decode(output_ids[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)
-            example['prediction'] = output_text.strip()
-            f.write(json.dumps(example, ensure_ascii=False) + '\n')
+        pending = {}
+        next_index = 0
+
+        def save(i, prediction):
+            global next_index
+            pending[i] = prediction
+            while next_index in pending:
+                example = data_list[next_index]
+                example['prediction'] = pending.pop(next_index)
+                f.write(json.dumps(example, ensure_ascii=False) + '\n')
+                next_index += 1
+
+        if args.reuse_prefix_cache:
+            # Left padding would shift the shared prefix, so this path runs one row at a time.
+            keys = [system_prompt_key(example["messages"]) for example in data_list]
+            prefix_cache = PrefixCache(model)
+            prefix_cache.build_for_groups(keys, input_ids_list)
+            for i in tqdm(range(len(data_list))):
+                input_ids = torch.tensor([input_ids_list[i]], device=device)
+                with torch.no_grad():
+                    output_ids = model.generate(
+                        input_ids=input_ids,
+                        attention_mask=torch.ones_like(input_ids),
+                        past_key_values=prefix_cache.get(keys[i], input_ids_list[i]),
+                        max_new_tokens=args.max_new_tokens,
+                        temperature=0.0,
+                        do_sample=False,
+                        pad_token_id=tokenizer.pad_token_id
+                    )
+                save(i, tokenizer.decode(output_ids[0][input_ids.shape[1]:], skip_special_tokens=True).strip())
+                f.flush()
+        else:
+            lengths = [len(ids) for ids in input_ids_list]
+            batches = length_bucketed_batches(lengths, args.max_new_tokens, args.max_batch_tokens)
+            for batch in tqdm(batches):
+                inputs = tokenizer([prompts[i] for i in batch], return_tensors="pt", padding=True, add_special_tokens=add_special_tokens).to(device)
+
+                with torch.no_grad():
+                    output_ids = model.generate(
+                        **inputs,
+                        max_new_tokens=args.max_new_tokens,
+                        temperature=0.0,
+                        do_sample=False,
+                        pad_token_id=tokenizer.pad_token_id
+                    )
+
+                # With left padding every prompt ends at the same column.
+                output_texts = tokenizer.batch_decode(output_ids[:, inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+                for i, output_text in zip(batch, output_texts):
+                    save(i, output_text.strip())
+                f.flush()
+
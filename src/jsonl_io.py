@@ -0,0 +1,188 @@
+import json
+import mmap
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Codec ---
+
+def loads(data) -> Any:
+    """Parses one JSON document from str or bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj: Any) -> str:
+    """
+    Serializes one JSON document without a trailing newline: compact separators and
+    unescaped non-ASCII, identical with and without orjson.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+# --- Reading ---
+
+def iter_lines(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yields (byte offset, line) for every non-empty line in [start, end) through a read-only mmap."""
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm) if end is None else end
+        pos = start
+        while pos < end:
+            nl = mm.find(b"\n", pos, end)
+            stop = end if nl == -1 else nl
+            line = mm[pos:stop]
+            if line.strip():
+                yield pos, line
+            pos = stop + 1
+
+def read_jsonl(path: str, start: int = 0, end: Optional[int] = None, skip_invalid: bool = True) -> Iterator[Dict[str, Any]]:
+    """Lazily parses a JSONL file. Malformed lines are reported and skipped unless skip_invalid is False."""
+    for _, line in iter_lines(path, start, end):
+        try:
+            yield loads(line)
+        except ValueError:
+            if not skip_invalid:
+                raise
+            print(f"Warning: Skipping line due to invalid JSON in {path}: {line[:200]!r}")
+
+# --- Writing ---
+
+class JsonlWriter:
+    """Appends rows one per line; use as a context manager."""
+
+    def __init__(self, path: str, mode: str = "w"):
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._f = open(path, mode, encoding="utf-8")
+
+    def write(self, row: Dict[str, Any]):
+        self._f.write(dumps(row) + "\n")
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def write_jsonl(path: str, rows: Iterable[Dict[str, Any]], mode: str = "w") -> int:
+    count = 0
+    with JsonlWriter(path, mode) as writer:
+        for row in rows:
+            writer.write(row)
+            count += 1
+    return count
+
+# --- Resuming ---
+
+def _drop_partial_line(path: str, block_size: int = 1 << 16):
+    """Truncates an unterminated last line left by an interrupted writer, so appends start on a new line."""
+    with open(path, "rb+") as f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(block_size, pos)
+            f.seek(pos - step)
+            nl = f.read(step).rfind(b"\n")
+            if nl >= 0:
+                pos = pos - step + nl + 1
+                break
+            pos -= step
+        if pos < end:
+            f.truncate(pos)
+
+def load_done_ids(path: str, key: str = "id", failed: Optional[Callable[[Dict[str, Any]], bool]] = None) -> set:
+    """
+    Ids of the rows an earlier run wrote to `path`, for resuming it. Rows for which
+    `failed(row)` holds are removed from the file so that they are run again.
+    """
+    done_ids, num_failed = set(), 0
+    if not os.path.exists(path):
+        return done_ids
+    for row in read_jsonl(path):
+        if failed is not None and failed(row):
+            num_failed += 1
+        elif row.get(key) is not None:
+            done_ids.add(row[key])
+    if num_failed:
+        tmp_path = path + ".tmp"
+        write_jsonl(tmp_path, (row for row in read_jsonl(path) if not failed(row)))
+        os.replace(tmp_path, path)
+    else:
+        _drop_partial_line(path)
+    return done_ids
+
+# --- Offset index ---
+
+def index_path(path: str, key: str) -> str:
+    return f"{path}.{key}.idx.json"
+
+def build_index(path: str, key: str = "id", persist: bool = True) -> Dict[str, Tuple[int, int]]:
+    """
+    Maps each row's `key` to its (byte offset, length). The index is saved next to the
+    file and reused while the file's size and mtime are unchanged.
+    """
+    stat = os.stat(path)
+    cached = index_path(path, key)
+    if os.path.exists(cached):
+        with open(cached, "rb") as f:
+            saved = loads(f.read())
+        if saved["size"] == stat.st_size and saved["mtime"] == stat.st_mtime:
+            return {k: tuple(v) for k, v in saved["offsets"].items()}
+
+    offsets = {}
+    for offset, line in iter_lines(path):
+        try:
+            value = loads(line).get(key)
+        except ValueError:
+            continue
+        if value is not None:
+            offsets[str(value)] = (offset, len(line))
+
+    if persist:
+        with open(cached, "w") as f:
+            f.write(dumps({"size": stat.st_size, "mtime": stat.st_mtime, "offsets": offsets}))
+    return offsets
+
+class JsonlIndex:
+    """O(1) random access to the rows of a JSONL file by key."""
+
+    def __init__(self, path: str, key: str = "id", persist: bool = True):
+        self.path = path
+        self.offsets = build_index(path, key, persist)
+        self._f = open(path, "rb")
+
+    def __contains__(self, value) -> bool:
+        return str(value) in self.offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def get(self, value, default=None) -> Optional[Dict[str, Any]]:
+        location = self.offsets.get(str(value))
+        if location is None:
+            return default
+        offset, length = location
+        self._f.seek(offset)
+        return loads(self._f.read(length))
+
+    def __getitem__(self, value) -> Dict[str, Any]:
+        row = self.get(value)
+        if row is None:
+            raise KeyError(value)
+        return row
+
+    def close(self):
+        self._f.close()
@@ -0,0 +1,121 @@
+import argparse
+import os
+from collections import defaultdict
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional
+
+from tqdm import tqdm
+from jsonl_io import read_jsonl, write_jsonl
+
+try:
+    import selfies as sf
+except ImportError:
+    sf = None
+
+try:
+    from rdkit import Chem, RDLogger
+    RDLogger.DisableLog("rdApp.*")
+except ImportError:
+    Chem = None
+
+def canonical_key(selfies_str: str) -> str:
+    """
+    Canonical SMILES of a SELFIES string, so the same molecule written differently maps
+    to one key. Without rdkit the decoded SMILES is used as is; strings that do not
+    decode or parse fall back to themselves.
+    """
+    if sf is None:
+        raise ImportError("molecule_index requires the selfies package (pip install selfies)")
+    try:
+        smiles = sf.decoder(selfies_str)
+    except Exception:
+        return selfies_str
+    if not smiles or Chem is None:
+        return smiles or selfies_str
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return smiles
+    return Chem.MolToSmiles(mol, canonical=True)
+
+def split_name(path: str) -> str:
+    """"<task>/<split>" from a dataset/original/<task>_<split>*.jsonl file name, else the file stem."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for split in ("train", "test", "valid", "val"):
+        if f"_{split}" in stem:
+            return f"{stem.split(f'_{split}')[0]}/{split}"
+    return stem
+
+def train_test_overlap(entry: Dict) -> bool:
+    """Whether the molecule is in both the train and the test split of the same task."""
+    splits = set(entry["splits"])
+    return any(s.endswith("/train") and s[:-len("train")] + "test" in splits for s in splits)
+
+def _canonical_batch(selfies_batch: List[str]) -> List[str]:
+    return [canonical_key(s) for s in selfies_batch]
+
+def build_molecule_index(input_paths: Iterable[str], selfies_column: str = "SELFIES", id_column: str = "id", num_workers: Optional[int] = None, batch_size: int = 512) -> List[Dict]:
+    """
+    One entry per unique molecule: its canonical key and every (id, split, label, file)
+    it appears under, in input order.
+    """
+    rows = []
+    for path in input_paths:
+        split = split_name(path)
+        for data in read_jsonl(path):
+            if data.get(selfies_column) and data.get(id_column) is not None:
+                rows.append((data[selfies_column], str(data[id_column]), split, data.get("result"), path))
+
+    batches = [[r[0] for r in rows[i:i + batch_size]] for i in range(0, len(rows), batch_size)]
+    keys = []
+    with Pool(num_workers or os.cpu_count()) as pool:
+        for batch_keys in tqdm(pool.imap(_canonical_batch, batches), total=len(batches), desc="Canonicalizing"):
+            keys.extend(batch_keys)
+
+    members = defaultdict(list)
+    for key, (_, item_id, split, label, path) in zip(keys, rows):
+        members[key].append({"id": item_id, "split": split, "label": label, "file": path})
+
+    return [
+        {
+            "key": key,
+            "splits": sorted({m["split"] for m in entries}),
+            "labels": sorted({str(m["label"]) for m in entries}),
+            "members": entries,
+        }
+        for key, entries in members.items()
+    ]
+
+def load_id_to_key(index_path: str) -> Dict[str, str]:
+    """Maps every indexed id to its canonical molecule key."""
+    return {m["id"]: entry["key"] for entry in read_jsonl(index_path) for m in entry["members"]}
+
+def report(index: List[Dict]):
+    num_rows = sum(len(entry["members"]) for entry in index)
+    duplicates = num_rows - len(index)
+    overlap = [entry for entry in index if train_test_overlap(entry)]
+    conflicting = [entry for entry in index if len(entry["labels"]) > 1]
+    print(f"Rows: {num_rows}, unique molecules: {len(index)}, duplicate rows: {duplicates} ({duplicates / max(num_rows, 1):.1%} of requests)")
+    print(f"Molecules in both train and test of a task: {len(overlap)}")
+    print(f"Molecules with conflicting labels: {len(conflicting)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Index SELFIES datasets by canonical molecule to deduplicate requests and find train/test overlap.")
+    parser.add_argument("--input_paths", type=str, nargs="+", required=True, help="jsonl files, e.g. dataset/original/hiv_train_2k.jsonl dataset/original/hiv_test.jsonl")
+    parser.add_argument("--output_path", type=str, required=True, help="Index jsonl, one line per unique molecule.")
+    parser.add_argument("--selfies_column", type=str, default="SELFIES", help="Column holding the SELFIES string.")
+    parser.add_argument("--id_column", type=str, default="id", help="Column holding the row id.")
+    parser.add_argument("--overlap_output", type=str, default=None, help="Write the index entries of molecules present in both train and test here.")
+    parser.add_argument("--num_workers", type=int, default=None, help="Canonicalization processes. Defaults to all cores.")
+    args = parser.parse_args()
+
+    index = build_molecule_index(args.input_paths, args.selfies_column, args.id_column, args.num_workers)
+    write_jsonl(args.output_path, index)
+    report(index)
+    print(f"Saved index to {args.output_path}")
+    if args.overlap_output:
+        overlap = [entry for entry in index if train_test_overlap(entry)]
+        write_jsonl(args.overlap_output, overlap)
+        print(f"Saved {len(overlap)} overlapping molecules to {args.overlap_output}")
+
+if __name__ == "__main__":
+    main()
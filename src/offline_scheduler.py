@@ -0,0 +1,110 @@
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Protocol, Tuple
+
+from tqdm import tqdm
+from jsonl_io import load_done_ids
+
+
+class ChatEngine(Protocol):
+    def chat(self, messages_batch: List[List[Dict[str, str]]]) -> Iterator[Tuple[int, str]]:
+        """Yields (index into messages_batch, generated text) as requests finish, in any order."""
+        ...
+
+
+class VLLMChatEngine:
+    """
+    Adds a whole chunk to the `LLMEngine` behind an `LLM` so vLLM's scheduler batches it
+    continuously, and steps the engine itself so each request is yielded as soon as it finishes.
+    """
+
+    def __init__(self, llm, sampling_params, wo_think: bool = False):
+        self.llm = llm
+        self.sampling_params = sampling_params
+        self.wo_think = wo_think
+        self._next_id = 0
+
+    def chat(self, messages_batch):
+        engine = self.llm.llm_engine
+        tokenizer = self.llm.get_tokenizer()
+        kwargs = {"enable_thinking": False} if self.wo_think else {}
+        first_id = self._next_id
+        for messages in messages_batch:
+            # Token ids, so the BOS the template already contains is not added again.
+            prompt_token_ids = tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True, **kwargs)
+            engine.add_request(str(self._next_id), {"prompt_token_ids": prompt_token_ids}, self.sampling_params)
+            self._next_id += 1
+        with tqdm(total=len(messages_batch), desc="Generating") as progress:
+            while engine.has_unfinished_requests():
+                for output in engine.step():
+                    if output.finished:
+                        progress.update(1)
+                        yield int(output.request_id) - first_id, output.outputs[0].text
+
+
+class EchoChatEngine:
+    """CPU stand-in that returns the last user message; used for dry runs of the scheduling layer."""
+
+    def chat(self, messages_batch):
+        for i, messages in enumerate(messages_batch):
+            yield i, messages[-1]["content"]
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Rough request size: ~4 characters per prompt token plus the full decode budget."""
+    return sum(len(m['content'] or '') for m in messages) // 4 + max_tokens
+
+
+def token_budgeted_chunks(rows: Iterable[Dict[str, Any]], chunk_tokens: int, max_tokens: int) -> Iterator[List[Dict[str, Any]]]:
+    """Groups rows into chunks of at most `chunk_tokens` estimated tokens. 0 puts everything in one chunk."""
+    chunk, size = [], 0
+    for row in rows:
+        cost = estimate_tokens(row['messages'], max_tokens)
+        if chunk and chunk_tokens > 0 and size + cost > chunk_tokens:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += cost
+    if chunk:
+        yield chunk
+
+
+def length_bucketed_batches(lengths: List[int], max_new_tokens: int, max_batch_tokens: int) -> List[List[int]]:
+    """
+    Groups example indices sorted by prompt length so that each batch's padded size,
+    batch_size * (longest prompt + max_new_tokens), stays within max_batch_tokens.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, batch, longest = [], [], 0
+    for i in order:
+        new_longest = max(longest, lengths[i])
+        if batch and (len(batch) + 1) * (new_longest + max_new_tokens) > max_batch_tokens:
+            batches.append(batch)
+            batch, new_longest = [], lengths[i]
+        batch.append(i)
+        longest = new_longest
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def run_single_submission(engine: ChatEngine, rows: List[Dict[str, Any]], save_path: str, chunk_tokens: int, max_tokens: int, resume: bool) -> int:
+    """
+    Generates predictions for `rows`, submitting each token-budgeted chunk at once and
+    appending each row to `save_path` as soon as its request finishes, so an interrupted
+    run keeps everything finished so far. Returns the number of rows written.
+    """
+    if resume:
+        done_ids = load_done_ids(save_path)
+        rows = [row for row in rows if row.get('id') not in done_ids]
+        print(f"Resuming: skipping {len(done_ids)} finished rows, {len(rows)} left.")
+
+    written = 0
+    with open(save_path, 'a' if resume else 'w', encoding='utf-8') as f:
+        for chunk in token_budgeted_chunks(rows, chunk_tokens, max_tokens):
+            for i, text in engine.chat([row['messages'] for row in chunk]):
+                row = chunk[i]
+                row['prediction'] = text
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+                f.flush()
+                written += 1
+    return written
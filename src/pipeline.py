@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, List, Set
+
+# Runs the stages of a JSON pipeline config (see pipeline.json) as a DAG. A stage is
+# one command line with the files it reads (deps) and writes (outs); stages that read
+# another stage's outs run after it, independent stages run in parallel. A stage is
+# skipped when its fingerprint (command, params, deps content, code content) matches
+# the last successful run and its outs are still what that run wrote.
+
+class FileHasher:
+    """sha256 of files and directories, reusing a digest while (size, mtime) are unchanged."""
+
+    def __init__(self, cache: Dict[str, Any]):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def _file(self, path: str) -> str:
+        stat = os.stat(path)
+        with self._lock:
+            cached = self.cache.get(path)
+        if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+            return cached["sha256"]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        with self._lock:
+            self.cache[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": h.hexdigest()}
+        return h.hexdigest()
+
+    def hash(self, path: str) -> str:
+        """None for missing paths."""
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    file_path = os.path.join(dirpath, name)
+                    h.update(os.path.relpath(file_path, path).encode("utf-8"))
+                    h.update(self._file(file_path).encode("utf-8"))
+            return h.hexdigest()
+        if os.path.exists(path):
+            return self._file(path)
+        return None
+
+def render_params(params: Dict[str, Any]) -> List[str]:
+    """{"resume": true, "input_paths": ["a", "b"], "n": 4} -> --resume --input_paths a b --n 4"""
+    argv = []
+    for key, value in params.items():
+        if value is False or value is None:
+            continue
+        argv.append(f"--{key}")
+        if isinstance(value, list):
+            argv.extend(str(v) for v in value)
+        elif value is not True:
+            argv.append(str(value))
+    return argv
+
+def substitute(value: Any, variables: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return value.format_map(variables)
+    if isinstance(value, list):
+        return [substitute(v, variables) for v in value]
+    if isinstance(value, dict):
+        return {k: substitute(v, variables) for k, v in value.items()}
+    return value
+
+def load_stages(config_path: str, overrides: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    variables = {"python": sys.executable, **config.get("vars", {}), **overrides}
+    stages = {}
+    for name, stage in config["stages"].items():
+        stage = substitute(stage, variables)
+        argv = shlex.split(stage["cmd"]) + render_params(stage.get("params", {}))
+        stdout = stage.get("stdout")
+        stages[name] = {
+            "argv": argv,
+            "deps": stage.get("deps", []),
+            # For scripts that only print their results, stdout is captured as an output.
+            "stdout": stdout,
+            "outs": stage.get("outs", []) + ([stdout] if stdout else []),
+            # The script itself always counts as code; shared modules can be listed.
+            "code": [a for a in argv if a.endswith(".py") and os.path.isfile(a)] + stage.get("code", []),
+            "after": stage.get("after", []),
+            "env": stage.get("env", {}),
+        }
+    return stages
+
+def upstream_graph(stages: Dict[str, Dict[str, Any]]) -> Dict[str, Set[str]]:
+    producers = {out: name for name, stage in stages.items() for out in stage["outs"]}
+    graph = {}
+    for name, stage in stages.items():
+        upstream = {producers[d] for d in stage["deps"] if d in producers} | set(stage["after"])
+        upstream.discard(name)
+        graph[name] = upstream
+    return graph
+
+def fingerprint(stage: Dict[str, Any], hasher: FileHasher) -> str:
+    payload = {
+        "argv": stage["argv"],
+        "env": stage["env"],
+        "deps": {d: hasher.hash(d) for d in stage["deps"]},
+        "code": {c: hasher.hash(c) for c in stage["code"]},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def up_to_date(name: str, stage: Dict[str, Any], state: Dict[str, Any], hasher: FileHasher) -> bool:
+    record = state.get(name)
+    if record is None or record["fingerprint"] != fingerprint(stage, hasher):
+        return False
+    return all(hasher.hash(out) is not None and hasher.hash(out) == record["outs"].get(out) for out in stage["outs"])
+
+def run_pipeline(stages, state, hasher, jobs=4, targets=None, force=(), dry_run=False, log_dir=None) -> bool:
+    """Runs the stages needed for `targets` (all when None). Returns False if any stage failed."""
+    graph = upstream_graph(stages)
+    selected = set(stages) if not targets else set()
+    pending_targets = list(targets or [])
+    while pending_targets:
+        name = pending_targets.pop()
+        if name not in selected:
+            selected.add(name)
+            pending_targets.extend(graph[name])
+
+    done, failed, would_run, running = set(), set(), set(), {}
+    lock = threading.Lock()
+
+    def execute(name):
+        stage = stages[name]
+        for out in stage["outs"]:
+            output_dir = os.path.dirname(out)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+        print(f"[run] {name}: {shlex.join(stage['argv'])}", flush=True)
+        start = time.monotonic()
+        env = {**os.environ, **{k: str(v) for k, v in stage["env"].items()}}
+        log_f = open(os.path.join(log_dir, f"{name}.log"), "w") if log_dir else None
+        stdout_f = open(stage["stdout"], "w") if stage["stdout"] else log_f
+        try:
+            stderr_f = subprocess.STDOUT if log_f is not None and stdout_f is log_f else log_f
+            returncode = subprocess.run(stage["argv"], env=env, stdout=stdout_f, stderr=stderr_f).returncode
+        finally:
+            for f in {log_f, stdout_f} - {None}:
+                f.close()
+        elapsed = time.monotonic() - start
+        if returncode != 0:
+            print(f"[fail] {name} exited with {returncode} after {elapsed:.1f}s", flush=True)
+            return False
+        missing = [out for out in stage["outs"] if not os.path.exists(out)]
+        if missing:
+            print(f"[fail] {name} did not write {missing}", flush=True)
+            return False
+        with lock:
+            state[name] = {"fingerprint": fingerprint(stage, hasher), "outs": {out: hasher.hash(out) for out in stage["outs"]}}
+        print(f"[done] {name} in {elapsed:.1f}s", flush=True)
+        return True
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            progressed = False
+            for name in sorted(selected - done - failed - set(running)):
+                upstream = graph[name] & selected
+                if upstream & failed:
+                    print(f"[skip] {name}: upstream failed", flush=True)
+                    failed.add(name)
+                    progressed = True
+                elif upstream <= done:
+                    progressed = True
+                    if dry_run and (name in force or upstream & would_run or not up_to_date(name, stages[name], state, hasher)):
+                        print(f"[would run] {name}: {shlex.join(stages[name]['argv'])}", flush=True)
+                        would_run.add(name)
+                        done.add(name)
+                    elif name not in force and up_to_date(name, stages[name], state, hasher):
+                        print(f"[up-to-date] {name}", flush=True)
+                        done.add(name)
+                    elif not dry_run:
+                        running[name] = pool.submit(execute, name)
+            if not running:
+                if progressed:
+                    continue
+                stuck = selected - done - failed
+                if stuck:
+                    print(f"[fail] dependency cycle among {sorted(stuck)}", flush=True)
+                    failed |= stuck
+                break
+            finished, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future in finished:
+                    del running[name]
+                    (done if future.result() else failed).add(name)
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a declarative pipeline of the repo's scripts, skipping stages whose inputs, code and params are unchanged.")
+    parser.add_argument("--config", type=str, default="pipeline.json", help="JSON file with vars and stages.")
+    parser.add_argument("--targets", type=str, nargs="*", default=None, help="Run only these stages and what they depend on.")
+    parser.add_argument("--force", type=str, nargs="*", default=[], help="Rerun these stages even if up to date.")
+    parser.add_argument("--jobs", type=int, default=4, help="Stages run in parallel.")
+    parser.add_argument("--dry_run", action="store_true", help="Print what would run without running it.")
+    parser.add_argument("--state_dir", type=str, default=".pipeline", help="Where fingerprints, file hashes and stage logs are kept.")
+    parser.add_argument("--log", action="store_true", help="Write each stage's output to <state_dir>/logs/<stage>.log instead of the terminal.")
+    parser.add_argument("--var", type=str, nargs="*", default=[], help="Override config vars, e.g. --var root=/data/kmel model_name=kmel")
+    args = parser.parse_args()
+
+    overrides = dict(v.split("=", 1) for v in args.var)
+    stages = load_stages(args.config, overrides)
+    unknown = [n for n in (args.targets or []) + args.force if n not in stages]
+    if unknown:
+        parser.error(f"unknown stages: {unknown}")
+    os.makedirs(args.state_dir, exist_ok=True)
+    state_path = os.path.join(args.state_dir, "state.json")
+    state = {"stages": {}, "files": {}}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+    log_dir = None
+    if args.log:
+        log_dir = os.path.join(args.state_dir, "logs")
+        os.makedirs(log_dir, exist_ok=True)
+
+    hasher = FileHasher(state["files"])
+    try:
+        ok = run_pipeline(stages, state["stages"], hasher, args.jobs, args.targets, set(args.force), args.dry_run, log_dir)
+    finally:
+        if not args.dry_run:
+            with open(state_path, "w") as f:
+                json.dump(state, f, indent=1)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import copy
+import torch
+from transformers import DynamicCache
+
+def common_prefix_length(sequences):
+    """Length of the longest token prefix shared by all sequences."""
+    first = sequences[0]
+    n = min(len(s) for s in sequences)
+    for seq in sequences[1:]:
+        i = 0
+        while i < n and seq[i] == first[i]:
+            i += 1
+        n = i
+    return n
+
+def system_prompt_key(messages):
+    return messages[0]['content'] if messages and messages[0]['role'] == 'system' else ''
+
+class PrefixCache:
+    """
+    Keeps the past_key_values of the prompt prefix shared by every row of one prompt
+    type (same system prompt), so generation only has to prefill each row's suffix.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._caches = {}
+
+    def build(self, key, prefix_ids):
+        cache = DynamicCache()
+        with torch.no_grad():
+            self.model(
+                input_ids=torch.tensor([prefix_ids], device=self.model.device),
+                past_key_values=cache,
+                use_cache=True,
+            )
+        self._caches[key] = (list(prefix_ids), cache)
+
+    def build_for_groups(self, keys, input_ids_list):
+        """Builds one cache per key from the token prefix common to all rows with that key."""
+        groups = {}
+        for key, ids in zip(keys, input_ids_list):
+            groups.setdefault(key, []).append(ids)
+        for key, group in groups.items():
+            # Leave at least one token per row uncached so generate() has something to prefill.
+            n = min(common_prefix_length(group), min(len(ids) for ids in group) - 1)
+            if n > 0:
+                self.build(key, group[0][:n])
+
+    def get(self, key, input_ids):
+        """Returns a private copy of the cached prefix for `input_ids`, or None if it does not apply."""
+        if key not in self._caches:
+            return None
+        prefix_ids, cache = self._caches[key]
+        if list(input_ids[:len(prefix_ids)]) != prefix_ids:
+            return None
+        # generate() appends to the cache in place, so every row needs its own copy.
+        return copy.deepcopy(cache)
@@ -1,15 +1,14 @@
-import json
 import argparse
-from datasets import load_dataset, Dataset
 from tqdm import tqdm
+from jsonl_io import read_jsonl, JsonlIndex, JsonlWriter
 
 
 def main():
     """Main function to run the data generation process."""
     parser = argparse.ArgumentParser(description="Generate a batch.jsonl file for OpenAI API from the HiCUPID dataset.")
     parser.add_argument("--input_data_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/original/bbbp_train.jsonl", help="Number of user_ids to process. Processes all users by default if not specified.")
-    parser.add_argument("--original_output_data_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch_output/bbbp_train_output.jsonl", help="Number of user_ids to process. Processes all users by default if not specified.")
-    parser.add_argument("--original_batch_data_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch/bbbp_train.jsonl", help="Number of user_ids to process. Processes all users by default if not specified.")
+    parser.add_argument("--original_output_data_path", type=str, nargs='+', default=["/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch_output/bbbp_train_output.jsonl"], help="Batch output file(s), one per round in order.")
+    parser.add_argument("--original_batch_data_path", type=str, nargs='+', default=["/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch/bbbp_train.jsonl"], help="Batch request file(s), one per output file.")
     
     parser.add_argument("--rejected_output_data_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch/bbbp_train2.jsonl", help="Number of user_ids to process. Processes all users by default if not specified.")
     parser.add_argument("--output_data_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/filtered_train_data/bbbp_train.jsonl", help="Number of user_ids to process. Processes all users by default if not specified.")
@@ -18,33 +17,39 @@ def main():
     parser.add_argument("--save_rejected", action='store_true', help="Number of user_ids to process. Processes all users by default if not specified.")
     args = parser.parse_args()
 
-    dataset = Dataset.from_json(args.input_data_path)
-    dataset_dict = {}
-    for k in dataset:
-        dataset_dict[k['id']]=k
-    
-    dataset_out = Dataset.from_json(args.original_output_data_path)
-    dataset_batch = Dataset.from_json(args.original_batch_data_path)
-    dataset_batch_dict = {}
-    for k in dataset_batch:
-        dataset_batch_dict[k['custom_id']]=k
+    if len(args.original_output_data_path) != len(args.original_batch_data_path):
+        parser.error("--original_output_data_path and --original_batch_data_path need one file per round each.")
 
+    # Only byte offsets are kept in memory; rows are read back on demand.
+    dataset_index = JsonlIndex(args.input_data_path, args.id_column, persist=False)
+    batch_indexes = [JsonlIndex(path, 'custom_id', persist=False) for path in args.original_batch_data_path]
 
-    final_list = []
-    rejected_list = []
-    for k in dataset_out:
-        pred_true = 'yes' in k['response']['body']['choices'][0]['message']['content'].lower().split('answer:')[-1].strip()
-        gt_true = dataset_dict[k['custom_id']]['result']=='Yes.'
-        if(pred_true==gt_true):
-            tmp = dataset_dict[k['custom_id']].copy()
-            tmp['reasoning'] = k['response']['body']['choices'][0]['message']['content']
-            final_list.append(tmp)
-        else:
-            rejected_list.append(dataset_batch_dict[k['custom_id']])
+    accepted_ids = set()
+    rejected_round = {}
+    with JsonlWriter(args.output_data_path) as accepted_out:
+        for round_idx, output_path in enumerate(args.original_output_data_path):
+            for k in tqdm(read_jsonl(output_path), desc=f"Joining {output_path}"):
+                custom_id = k['custom_id']
+                if custom_id in accepted_ids:
+                    continue
+                original = dataset_index[custom_id]
+                content = k['response']['body']['choices'][0]['message']['content']
+                pred_true = 'yes' in content.lower().split('answer:')[-1].strip()
+                gt_true = original['result']=='Yes.'
+                if(pred_true==gt_true):
+                    original['reasoning'] = content
+                    accepted_out.write(original)
+                    accepted_ids.add(custom_id)
+                    rejected_round.pop(custom_id, None)
+                else:
+                    rejected_round[custom_id] = round_idx
 
-    Dataset.from_list(final_list).to_json(args.output_data_path)
+    print(f"Accepted {len(accepted_ids)} rows, rejected {len(rejected_round)} rows.")
     if(args.save_rejected):
-        Dataset.from_list(rejected_list).to_json(args.rejected_output_data_path)
+        # Re-queue the request from the latest round in which the id was rejected.
+        with JsonlWriter(args.rejected_output_data_path) as rejected_out:
+            for custom_id, round_idx in rejected_round.items():
+                rejected_out.write(batch_indexes[round_idx][custom_id])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,92 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from jsonl_io import JsonlWriter
+
+def new_stats() -> Dict[str, Any]:
+    """Per-request fields filled in by the clients' request functions."""
+    return {
+        "latency_s": None,
+        "ttft_s": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "retries": 0,
+        "status": None,
+        "cached": False,
+    }
+
+def fill_stats(stats: Optional[Dict[str, Any]], start: float, usage=None, retries: int = 0, status: str = "ok", ttft: Optional[float] = None):
+    if stats is None:
+        return
+    stats["latency_s"] = time.monotonic() - start
+    stats["ttft_s"] = ttft
+    stats["retries"] = retries
+    stats["status"] = status
+    if usage is not None:
+        stats["prompt_tokens"] = usage.prompt_tokens
+        stats["completion_tokens"] = usage.completion_tokens
+
+class RequestMetrics:
+    """
+    Writes one JSONL line per request (queue wait, TTFT, latency, token usage, retries)
+    to a sidecar file, logs a running summary every `log_interval` seconds and builds
+    an end-of-run report.
+    """
+
+    def __init__(self, path: Optional[str] = None, log_interval: float = 30.0, top_k: int = 5):
+        self._writer = JsonlWriter(path) if path else None
+        self.path = path
+        self.log_interval = log_interval
+        self.top_k = top_k
+        self.start = time.monotonic()
+        self._last_log = self.start
+        self.records: List[Dict[str, Any]] = []
+
+    def record(self, item_id: Any, queue_wait: Optional[float], stats: Dict[str, Any], **extra):
+        record = {"id": item_id, "time": time.time(), "queue_wait_s": queue_wait, **stats, **extra}
+        self.records.append(record)
+        if self._writer is not None:
+            self._writer.write(record)
+            self._writer.flush()
+        now = time.monotonic()
+        if now - self._last_log > self.log_interval:
+            self._last_log = now
+            logging.info(self.live_summary())
+
+    def _totals(self):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        completion = sum(r["completion_tokens"] or 0 for r in self.records)
+        prompt = sum(r["prompt_tokens"] or 0 for r in self.records)
+        return elapsed, prompt, completion
+
+    def live_summary(self) -> str:
+        elapsed, _, completion = self._totals()
+        latencies = [r["latency_s"] for r in self.records[-1000:] if r["latency_s"] is not None and not r["cached"]]
+        p50 = f"{np.percentile(latencies, 50):.2f}s" if latencies else "n/a"
+        return f"Requests: {len(self.records)} ({len(self.records) / elapsed:.2f}/s), {completion / elapsed:.0f} completion tok/s, recent p50 latency {p50}"
+
+    def summary(self) -> str:
+        elapsed, prompt, completion = self._totals()
+        sent = [r for r in self.records if not r["cached"]]
+        failed = [r for r in sent if r["status"] != "ok"]
+        lines = [
+            f"Requests: {len(self.records)} in {elapsed:.1f}s ({len(self.records) - len(sent)} cached, {len(failed)} failed, {sum(r['retries'] for r in sent)} client retries)",
+            f"Tokens: {prompt} prompt, {completion} completion ({completion / elapsed:.0f} completion tok/s)",
+        ]
+        for field in ("queue_wait_s", "ttft_s", "latency_s", "completion_tokens"):
+            values = [r[field] for r in sent if r[field] is not None]
+            if values:
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                lines.append(f"{field}: p50 {p50:.2f}, p95 {p95:.2f}, p99 {p99:.2f}, max {max(values):.2f}")
+        longest = sorted((r for r in sent if r["completion_tokens"]), key=lambda r: r["completion_tokens"], reverse=True)[:self.top_k]
+        if longest:
+            lines.append("Longest completions: " + ", ".join(f"{r['id']} ({r['completion_tokens']} tok, {r['latency_s']:.1f}s)" for r in longest))
+        if self.path:
+            lines.append(f"Per-request metrics: {self.path}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
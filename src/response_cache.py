@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM responses keyed by a hash of
+    (model, messages, sampling params), stored in SQLite with least-recently-used
+    eviction once the stored text exceeds `max_bytes`.
+
+    Requests sampled above `max_temperature` are not cached unless the caller
+    asks for it, since repeating them is expected to give different answers.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 2 * 1024 ** 3, max_temperature: float = 0.1):
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, params: Dict[str, Any]) -> bool:
+        return params.get("temperature", 1.0) <= self.max_temperature
+
+    def get(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any], force: bool = False) -> Optional[str]:
+        if not (force or self.cacheable(params)):
+            return None
+        key = self.make_key(model, messages, params)
+        row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return row[0]
+
+    def put(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any], value: str, force: bool = False):
+        if value is None or not (force or self.cacheable(params)):
+            return
+        key = self.make_key(model, messages, params)
+        size = len(value.encode("utf-8"))
+        old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()),
+        )
+        self._total_bytes += size - (old[0] if old else 0)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache is back under 90% of max_bytes."""
+        target = int(self.max_bytes * 0.9)
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if self._total_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total_bytes -= size
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({rate:.1%} hit rate), {self._total_bytes / 1e6:.1f} MB in {self.path}"
+
+    def close(self):
+        self._conn.close()
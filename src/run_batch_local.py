@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from openai import AsyncOpenAI, APIStatusError
+from tqdm import tqdm
+from jsonl_io import load_done_ids, read_jsonl
+
+# Keys, key order and separators follow the OpenAI Batch API output file so that
+# rejection_save.py and other consumers cannot tell the two apart.
+
+def batch_output_line(custom_id: str, status_code: Optional[int], request_id: Optional[str], body: Optional[Dict[str, Any]], error: Optional[Dict[str, Any]]) -> str:
+    response = None
+    if status_code is not None:
+        response = {"status_code": status_code, "request_id": request_id, "body": body}
+    return json.dumps({
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": custom_id,
+        "response": response,
+        "error": error,
+    })
+
+async def execute_request(job: Dict[str, Any], session: AsyncOpenAI, model_name: Optional[str]):
+    """Runs one batch job. Returns (output line, succeeded, completion tokens)."""
+    body = dict(job["body"])
+    if model_name:
+        body["model"] = model_name
+    url = job.get("url", "/v1/chat/completions")
+    endpoint = session.completions if url.endswith("/completions") and "chat" not in url else session.chat.completions
+
+    try:
+        raw = await endpoint.with_raw_response.create(**body)
+        response_body = json.loads(raw.text)
+        request_id = raw.headers.get("x-request-id") or f"req_{uuid.uuid4().hex}"
+        tokens = (response_body.get("usage") or {}).get("completion_tokens", 0)
+        return batch_output_line(job["custom_id"], raw.status_code, request_id, response_body, None), True, tokens
+    except APIStatusError as e:
+        logging.error(f"Request {job['custom_id']} failed with status {e.status_code}: {e}")
+        error_body = e.body if isinstance(e.body, dict) else {"error": {"message": str(e)}}
+        request_id = e.response.headers.get("x-request-id") or f"req_{uuid.uuid4().hex}"
+        return batch_output_line(job["custom_id"], e.status_code, request_id, error_body, None), False, 0
+    except Exception as e:
+        logging.error(f"Request {job['custom_id']} failed: {e}")
+        return batch_output_line(job["custom_id"], None, None, None, {"code": type(e).__name__, "message": str(e)}), False, 0
+
+async def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    error_path = args.error_path or os.path.splitext(args.output_path)[0] + "_errors.jsonl"
+    completed = load_done_ids(args.output_path, key="custom_id") if args.resume else set()
+    if completed:
+        logging.info(f"Resuming: {len(completed)} requests already completed in {args.output_path}.")
+    for path in ([error_path] if args.resume else [args.output_path, error_path]):
+        # Failed requests are retried on resume, so their old error lines are dropped.
+        if os.path.exists(path):
+            os.remove(path)
+
+    session = AsyncOpenAI(base_url=args.api_base_url, api_key=args.api_key, max_retries=args.max_retries)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.semaphore_limit * 2)
+    progress = tqdm(desc="Executing batch", unit="req")
+    start = time.monotonic()
+    total_tokens = 0
+    num_failed = 0
+
+    with open(args.output_path, "a") as out_f, open(error_path, "a") as err_f:
+        async def producer():
+            for job in read_jsonl(args.batch_path):
+                if job["custom_id"] not in completed:
+                    await queue.put(job)
+            for _ in range(args.semaphore_limit):
+                await queue.put(None)
+
+        async def worker():
+            nonlocal total_tokens, num_failed
+            while True:
+                job = await queue.get()
+                if job is None:
+                    break
+                line, succeeded, tokens = await execute_request(job, session, args.model_name)
+                # Flushed per line so that an interrupted run leaves at most one partial line to drop on resume.
+                if succeeded:
+                    out_f.write(line + "\n")
+                    out_f.flush()
+                else:
+                    err_f.write(line + "\n")
+                    err_f.flush()
+                    num_failed += 1
+                total_tokens += tokens
+                progress.update(1)
+                elapsed = time.monotonic() - start
+                progress.set_postfix(tok_s=f"{total_tokens / elapsed:.0f}")
+
+        await asyncio.gather(producer(), *(worker() for _ in range(args.semaphore_limit)))
+
+    progress.close()
+    elapsed = time.monotonic() - start
+    logging.info(
+        f"Executed {progress.n} requests in {elapsed:.1f}s "
+        f"({progress.n / elapsed:.2f} req/s, {total_tokens / elapsed:.0f} completion tokens/s). "
+        f"Output: {args.output_path}, {num_failed} failed requests in {error_path}"
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run an OpenAI batch input file against an OpenAI-compatible server and write a Batch API style output file.")
+    parser.add_argument("--batch_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch/hiv_train_2k.jsonl", help="Batch input .jsonl (custom_id, method, url, body).")
+    parser.add_argument("--output_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/openai_batch_output/hiv_train_2k_output.jsonl", help="Where to write the batch output .jsonl.")
+    parser.add_argument("--error_path", type=str, default=None, help="Where failed requests go, as with the Batch API error file. Defaults to <output>_errors.jsonl.")
+    parser.add_argument("--api_base_url", type=str, default="http://localhost:8000/v1/", help="API base URL for the LLM.")
+    parser.add_argument("--api_key", type=str, default="EMPTY", help="API key for the LLM.")
+    parser.add_argument("--model_name", type=str, default=None, help="Overrides body.model, e.g. the name served by vLLM.")
+    parser.add_argument("--semaphore_limit", type=int, default=256, help="Concurrency limit for API requests.")
+    parser.add_argument("--max_retries", type=int, default=2, help="Client-side retries per request.")
+    parser.add_argument("--resume", action="store_true", help="Keep the results in --output_path and only run requests missing from it, including previously failed ones.")
+
+    args = parser.parse_args()
+    asyncio.run(main(args))
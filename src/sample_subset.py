@@ -0,0 +1,123 @@
+import argparse
+import hashlib
+import math
+import random
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from jsonl_io import write_jsonl
+from columnar_io import iter_rows
+
+# Replaces notebooks/ratio.ipynb and notebooks/filter_new.ipynb:
+#   ratio.ipynb (1000 rows per label of hiv_train):
+#     python src/sample_subset.py --input_path dataset/original/hiv_train.jsonl --output_path dataset/original/hiv_train_2k.jsonl
+#   filter_new.ipynb (positives not yet in an earlier subset):
+#     python src/sample_subset.py --input_path dataset/original/hiv_train.jsonl --output_path dataset/original/hiv_t.jsonl \
+#         --counts "Yes.=-1" "No.=0" --exclude_paths dataset/filtered_train_data/hiv_train_10k.jsonl
+
+class BloomFilter:
+    """Set membership in a fixed bit array; no false negatives, false positives at about `error_rate`."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+def load_excluded_ids(paths: Iterable[str], id_column: str, bloom: bool = False, error_rate: float = 0.001):
+    """Ids of the rows in `paths` as a set, or as a BloomFilter sized after a counting pass."""
+    paths = list(paths)
+    if not bloom:
+        return {str(row[id_column]) for path in paths for row in iter_rows(path, [id_column]) if row[id_column] is not None}
+    capacity = sum(1 for path in paths for _ in iter_rows(path, [id_column]))
+    excluded = BloomFilter(capacity, error_rate)
+    for path in paths:
+        for row in iter_rows(path, [id_column]):
+            if row[id_column] is not None:
+                excluded.add(str(row[id_column]))
+    return excluded
+
+def stratified_sample(rows: Iterable[Dict[str, Any]], label_column: str, counts: Dict[str, int], default_count: Optional[int], id_column: str, excluded=None, seed: int = 0):
+    """
+    Single-pass reservoir sampling (Algorithm R) of up to counts[label] rows per label.
+    Labels missing from `counts` get `default_count`, or are dropped when it is None;
+    a negative count keeps every row of that label. Returns the shuffled sample and
+    per-label statistics.
+    """
+    rng = random.Random(seed)
+    reservoirs: Dict[str, List[Dict[str, Any]]] = {}
+    seen, dropped = Counter(), Counter()
+    for row in rows:
+        label = str(row.get(label_column))
+        k = counts.get(label, default_count)
+        if k is None or k == 0:
+            continue
+        if excluded is not None and str(row.get(id_column)) in excluded:
+            dropped[label] += 1
+            continue
+        seen[label] += 1
+        reservoir = reservoirs.setdefault(label, [])
+        if k < 0 or len(reservoir) < k:
+            reservoir.append(row)
+        else:
+            j = rng.randrange(seen[label])
+            if j < k:
+                reservoir[j] = row
+
+    sample = [row for label in sorted(reservoirs) for row in reservoirs[label]]
+    rng.shuffle(sample)
+    stats = {label: {"seen": seen[label], "excluded": dropped[label], "kept": len(reservoirs.get(label, []))} for label in sorted(set(seen) | set(dropped))}
+    return sample, stats
+
+def parse_counts(items: List[str]) -> Dict[str, int]:
+    counts = {}
+    for item in items:
+        label, count = item.rsplit("=", 1)
+        counts[label] = int(count)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw a seeded, label-stratified sample from a jsonl/parquet file in one pass, excluding ids of earlier files.")
+    parser.add_argument("--input_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/original/hiv_train.jsonl", help="Corpus to sample from (.jsonl or .parquet).")
+    parser.add_argument("--output_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning3/dataset/original/hiv_train_2k.jsonl", help="Where the sample is written (.jsonl).")
+    parser.add_argument("--label_column", type=str, default="result", help="Column to stratify on.")
+    parser.add_argument("--id_column", type=str, default="id", help="Column matched against --exclude_paths.")
+    parser.add_argument("--count_per_label", type=int, default=1000, help="Rows per label for labels not in --counts. -1 keeps all, 0 drops the label.")
+    parser.add_argument("--counts", type=str, nargs="*", default=[], help='Per-label overrides, e.g. --counts "Yes.=-1" "No.=0" keeps every positive and no negatives.')
+    parser.add_argument("--exclude_paths", type=str, nargs="*", default=[], help="Files whose ids must not be sampled, e.g. earlier subsets or filtered_train_data outputs.")
+    parser.add_argument("--bloom", action="store_true", help="Hold excluded ids in a bloom filter instead of a set (bounded memory, rare false exclusions).")
+    parser.add_argument("--bloom_error_rate", type=float, default=0.001, help="False positive rate of --bloom.")
+    parser.add_argument("--seed", type=int, default=0, help="Same seed and inputs give the same sample.")
+    args = parser.parse_args()
+
+    excluded = None
+    if args.exclude_paths:
+        excluded = load_excluded_ids(args.exclude_paths, args.id_column, args.bloom, args.bloom_error_rate)
+        if isinstance(excluded, BloomFilter):
+            print(f"Excluding ids from {len(args.exclude_paths)} files through a {len(excluded.bits) / 1e6:.1f} MB bloom filter")
+        else:
+            print(f"Excluding {len(excluded)} ids from {len(args.exclude_paths)} files")
+
+    sample, stats = stratified_sample(
+        iter_rows(args.input_path), args.label_column, parse_counts(args.counts), args.count_per_label,
+        args.id_column, excluded, args.seed,
+    )
+    for label, s in stats.items():
+        print(f"{label}: {s['kept']} kept of {s['seen']} candidates ({s['excluded']} excluded)")
+    write_jsonl(args.output_path, sample)
+    print(f"Saved {len(sample)} rows to {args.output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import logging
+import math
+from typing import Any, Dict, List, Optional
+
+from tqdm import tqdm
+from tqdm.asyncio import tqdm_asyncio
+from chat_format import read_chat_jsonl
+from jsonl_io import write_jsonl
+
+ANSWER_CUE = "ANSWER:"
+
+def prompt_messages(row: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Chat without any stored assistant turn, followed by the answer cue to continue from."""
+    messages = [m for m in row["messages"] if m["role"] != "assistant"]
+    return messages + [{"role": "assistant", "content": ANSWER_CUE}]
+
+def p_yes_from_logprobs(top_logprobs: Dict[str, float]) -> float:
+    """Normalizes the YES/NO mass among the top candidate tokens. 0.5 if neither appears."""
+    p_yes, p_no = 0.0, 0.0
+    for token, logprob in top_logprobs.items():
+        word = token.strip().upper()
+        if word == "YES":
+            p_yes += math.exp(logprob)
+        elif word == "NO":
+            p_no += math.exp(logprob)
+    if p_yes + p_no == 0:
+        return 0.5
+    return p_yes / (p_yes + p_no)
+
+# --- OpenAI-compatible server ---
+
+async def score_row_openai(row, session, semaphore, model_name, top_logprobs) -> Optional[float]:
+    from openai import APIError
+    async with semaphore:
+        try:
+            response = await session.chat.completions.create(
+                model=model_name,
+                messages=prompt_messages(row),
+                max_tokens=1,
+                temperature=0,
+                logprobs=True,
+                top_logprobs=top_logprobs,
+                # vLLM: continue the assistant turn that ends with the answer cue.
+                extra_body={"continue_final_message": True, "add_generation_prompt": False},
+            )
+            candidates = response.choices[0].logprobs.content[0].top_logprobs
+            return p_yes_from_logprobs({c.token: c.logprob for c in candidates})
+        except APIError as e:
+            logging.error(f"API Error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred during API call: {e}")
+        return None
+
+async def score_openai(rows, args) -> List[Optional[float]]:
+    from openai import AsyncOpenAI
+    session = AsyncOpenAI(base_url=args.api_base_url, api_key=args.api_key)
+    semaphore = asyncio.Semaphore(args.semaphore_limit)
+    tasks = [score_row_openai(row, session, semaphore, args.model_name, args.top_logprobs) for row in rows]
+    return await tqdm_asyncio.gather(*tasks, desc="Scoring")
+
+# --- Local HF model ---
+
+def score_hf(rows, args) -> List[float]:
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path, trust_remote_code=True)
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(args.model_path, trust_remote_code=True).to(device)
+    model.eval()
+
+    def first_token_ids(words):
+        return sorted({tokenizer.encode(w, add_special_tokens=False)[0] for w in words})
+    yes_ids = first_token_ids(["YES", " YES", "Yes", " Yes"])
+    no_ids = first_token_ids(["NO", " NO", "No", " No"])
+
+    prompts = [
+        tokenizer.apply_chat_template(prompt_messages(row), tokenize=False, continue_final_message=True)
+        for row in rows
+    ]
+    scores = []
+    for i in tqdm(range(0, len(prompts), args.batch_size), desc="Scoring"):
+        inputs = tokenizer(prompts[i:i + args.batch_size], return_tensors="pt", padding=True, add_special_tokens=False).to(device)
+        with torch.no_grad():
+            logits = model(**inputs).logits[:, -1, :]
+        probs = torch.softmax(logits.float(), dim=-1)
+        p_yes = probs[:, yes_ids].sum(dim=-1)
+        p_no = probs[:, no_ids].sum(dim=-1)
+        total = p_yes + p_no
+        # 0.5 when neither token has any mass, as p_yes_from_logprobs does.
+        scores.extend(torch.where(total > 0, p_yes / total.clamp_min(1e-12), torch.full_like(total, 0.5)).tolist())
+    return scores
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rows = list(read_chat_jsonl(args.dataset_path))
+
+    if args.backend == "openai":
+        scores = asyncio.run(score_openai(rows, args))
+    else:
+        scores = score_hf(rows, args)
+
+    for row, score in zip(rows, scores):
+        row["p_yes"] = score
+    write_jsonl(args.save_path, rows)
+    logging.info(f"Saved P(YES) for {len(rows)} rows to {args.save_path}")
+
+    y_true = [1 if row["result"] == "Yes." else 0 for row, s in zip(rows, scores) if s is not None]
+    y_score = [s for s in scores if s is not None]
+    if len(set(y_true)) == 2:
+        from sklearn import metrics
+        from evaluate_auroc import bootstrap_auroc
+        low, high = bootstrap_auroc(y_true, y_score, args.n_bootstrap)
+        print(f"AUROC: {metrics.roc_auc_score(y_true, y_score):.4f} (95% CI [{low:.4f}, {high:.4f}], {len(y_score)} rows)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score P(YES) from the first answer token instead of generating full reasoning.")
+    parser.add_argument("--backend", type=str, default="openai", choices=["openai", "hf"], help="OpenAI-compatible server or local transformers model")
+    parser.add_argument("--dataset_path", type=str, default="/home/tkdrnjs0621/work/kmel-reasoning4/dataset/chat/hiv_test_reasoning_chat.jsonl", help="chat-formatted jsonl")
+    parser.add_argument("--save_path", type=str, default="scores.jsonl", help="input rows with an added p_yes column")
+    parser.add_argument("--model_name", type=str, default="kmel", help="served model name for --backend openai")
+    parser.add_argument("--api_base_url", type=str, default="http://localhost:8010/v1/", help="API base URL for the LLM.")
+    parser.add_argument("--api_key", type=str, default="EMPTY", help="API key for the LLM.")
+    parser.add_argument("--semaphore_limit", type=int, default=500, help="Concurrency limit for API requests.")
+    parser.add_argument("--top_logprobs", type=int, default=20, help="candidate tokens returned per request")
+    parser.add_argument("--model_path", type=str, default=None, help="model for --backend hf")
+    parser.add_argument("--batch_size", type=int, default=16, help="rows per forward pass for --backend hf")
+    parser.add_argument("--n_bootstrap", type=int, default=1000, help="bootstrap resamples for the AUROC confidence interval")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,74 @@
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from early_stop import ANSWER_LINE
+
+def parse_vote(text: Optional[str]) -> Optional[str]:
+    """YES/NO from the last answer line of a sample, None when it did not answer."""
+    matches = ANSWER_LINE.findall(text + "\n") if text else []
+    return matches[-1] if matches else None
+
+class SelfConsistency:
+    """
+    Majority vote over sampled reasoning traces with Wald's sequential probability ratio
+    test deciding when to stop: H1 "the model answers YES with probability p" against
+    H0 "it answers NO with probability p". Every YES vote adds log(p / (1 - p)) to the
+    log-likelihood ratio and every NO vote subtracts it; sampling stops once the ratio
+    crosses log((1 - beta) / alpha) or log(beta / (1 - alpha)), or after `max_votes`
+    samples. Samples without an answer line abstain.
+    """
+
+    def __init__(self, max_votes: int = 16, votes_per_request: int = 4, p: float = 0.7, alpha: float = 0.05, beta: float = 0.05):
+        self.max_votes = max_votes
+        self.votes_per_request = votes_per_request
+        self.step = math.log(p / (1 - p))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.rows = 0
+        self.decided = 0
+        self.samples = 0
+        self.tokens = 0
+
+    def decision(self, votes: Counter) -> Optional[str]:
+        llr = (votes["YES"] - votes["NO"]) * self.step
+        if llr >= self.upper:
+            return "YES"
+        if llr <= self.lower:
+            return "NO"
+        return None
+
+    def next_batch(self, drawn: int) -> int:
+        """Samples to request next, 0 once the budget is spent."""
+        return max(0, min(self.votes_per_request, self.max_votes - drawn))
+
+    def finish(self, texts: List[str], drawn: int, tokens: int) -> Dict[str, Any]:
+        """
+        Output fields of a row: a response agreeing with the majority, the vote counts and
+        `p_yes`, the fraction of YES among the answered votes (0.5 without any).
+        """
+        answers = [parse_vote(text) for text in texts]
+        votes = Counter(answer or "abstain" for answer in answers)
+        decided = self.decision(votes)
+        majority = decided or ("YES" if votes["YES"] > votes["NO"] else "NO" if votes["NO"] > votes["YES"] else None)
+        answered = votes["YES"] + votes["NO"]
+        response = next((text for text, answer in zip(texts, answers) if answer == majority), texts[0] if texts else None)
+
+        self.rows += 1
+        self.decided += decided is not None
+        self.samples += drawn
+        self.tokens += tokens
+        return {
+            "llm_response": response,
+            "p_yes": votes["YES"] / answered if answered else 0.5,
+            "votes": {"YES": votes["YES"], "NO": votes["NO"], "abstain": votes["abstain"]},
+            "num_samples": drawn,
+            "vote_decided": decided is not None,
+        }
+
+    def summary(self) -> str:
+        rows = max(self.rows, 1)
+        return (
+            f"Self-consistency: {self.rows} rows, {self.decided} decided by the SPRT, "
+            f"{self.samples / rows:.1f} samples and {self.tokens / rows:.0f} completion tokens per row (budget {self.max_votes} samples)"
+        )